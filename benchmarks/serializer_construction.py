@@ -0,0 +1,66 @@
+"""
+Microseconds to construct a BaseModelSerializer with a nested many=True relation, on its own and for a list of
+instances, and to render that list.
+
+    python benchmarks/serializer_construction.py --number 2000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+
+import django
+
+django.setup()
+
+from core.serializers import BaseModelSerializer
+from tests.models import Author, Book
+
+
+class BookSerializer(BaseModelSerializer):
+
+    class Meta:
+        model = Book
+        fields = ["id", "title", "pages"]
+
+
+class AuthorSerializer(BaseModelSerializer):
+    books = BookSerializer(many=True, required=False, source="book_list", nested_relation=True, related_name="books",
+                           model_name_in_related_object="author", create_serializer=BookSerializer,
+                           edit_serializer=BookSerializer)
+
+    class Meta:
+        model = Author
+        fields = ["id", "name", "books"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--instances", type=int, default=100)
+    args = parser.parse_args()
+
+    authors = []
+    for index in range(args.instances):
+        author = Author(id=index, name=f"author {index}")
+        author.book_list = [Book(id=index * 3 + book, author=author, title=f"book {book}") for book in range(3)]
+        authors.append(author)
+
+    cases = [
+        ("AuthorSerializer()", lambda: AuthorSerializer()),
+        (f"AuthorSerializer({args.instances} authors, many=True)", lambda: AuthorSerializer(authors, many=True)),
+        (f"AuthorSerializer({args.instances} authors, many=True).data",
+         lambda: AuthorSerializer(authors, many=True).data),
+    ]
+
+    for name, case in cases:
+        number = max(args.number // (args.instances if name.endswith(".data") else 1), 1)
+        duration = timeit.timeit(case, number=number)
+        print(f"{name:<50} {duration / number * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
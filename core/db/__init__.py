@@ -1 +1 @@
-from ..db import fields, models
\ No newline at end of file
+from ..db import fields, models, versions
\ No newline at end of file
@@ -7,6 +7,8 @@ from django.db.utils import IntegrityError
 
 import logging
 
+from . import versions
+
 
 class SoftDeletionManager(models.Manager):
     def __init__(self, *args, **kwargs):
@@ -47,10 +49,29 @@ class SoftDeletionManager(models.Manager):
 
 class SoftDeletionQuerySet(QuerySet):
     def delete(self):
-        return super(SoftDeletionQuerySet, self).update(deleted_at=timezone.now())
+        result = super(SoftDeletionQuerySet, self).update(deleted_at=timezone.now())
+        versions.bump_on_write(self.model)
+        return result
 
     def hard_delete(self):
-        return super(SoftDeletionQuerySet, self).delete()
+        result = super(SoftDeletionQuerySet, self).delete()
+        versions.bump_on_write(self.model)
+        return result
+
+    def update(self, **kwargs):
+        result = super(SoftDeletionQuerySet, self).update(**kwargs)
+        versions.bump_on_write(self.model)
+        return result
+
+    def bulk_create(self, *args, **kwargs):
+        result = super(SoftDeletionQuerySet, self).bulk_create(*args, **kwargs)
+        versions.bump_on_write(self.model)
+        return result
+
+    def bulk_update(self, *args, **kwargs):
+        result = super(SoftDeletionQuerySet, self).bulk_update(*args, **kwargs)
+        versions.bump_on_write(self.model)
+        return result
 
     def alive(self):
         return self.filter(deleted_at=None)
@@ -71,12 +92,17 @@ class SmartModel(models.Model):
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        super(SmartModel, self).save(*args, **kwargs)
+        versions.bump_on_write(type(self))
+
     def delete(self):
         self.deleted_at = timezone.now()
         self.save()
 
     def hard_delete(self):
         super(SmartModel, self).delete()
+        versions.bump_on_write(type(self))
 
     def id_prefix(self):
         return ""
@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def get_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", "default")]
+
+
+def is_enabled():
+    """
+    Writes to the models bump their versions only with 'API_CACHE_VERSIONS' set, which the caches keyed by
+    model versions ('cache_responses', the 'cached' count mode) need.
+    """
+    return getattr(settings, "API_CACHE_VERSIONS", False)
+
+
+def get_key(model):
+    """
+    :param model: A model, or the name of anything else that is versioned
+    """
+    if isinstance(model, str):
+        return f"api-utils:version:{model}"
+
+    return f"api-utils:version:{model._meta.concrete_model._meta.label_lower}"
+
+
+def get_versions(models):
+    """
+    The current version counter of each model, a missing counter is (re)started from the current time so a
+    counter that was evicted never comes back with a version that was already used.
+    """
+    cache = get_cache()
+
+    keys = [get_key(model) for model in models]
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+
+def get_version(model):
+    return get_versions([model])[0]
+
+
+def bump(model):
+    """
+    Invalidates everything cached against the model's version. When called inside a transaction the version
+    is bumped again on commit, so nothing read before the commit stays cached.
+    """
+    _increment(get_key(model))
+
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _increment(get_key(model)))
+
+
+def bump_on_write(model):
+    """
+    Called after every write to a SmartModel, bumps its version if 'is_enabled'.
+    """
+    if is_enabled():
+        bump(model)
+
+
+def _increment(key):
+    cache = get_cache()
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.views import QueryStats
+
+
+class Command(BaseCommand):
+    help = "Lists the SQL fingerprints that dominate database time, collected with the API_QUERY_STATS setting"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--order-by", choices=QueryStats.ORDERINGS, default="total")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--view", help="Only the views whose name contains it")
+        parser.add_argument("--json", action="store_true", help="Print the statistics as JSON")
+        parser.add_argument("--reset", action="store_true", help="Clear the statistics of every process")
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            QueryStats.reset()
+            self.stdout.write("Query statistics cleared")
+            return
+
+        results = QueryStats.stats(order_by=options["order_by"], limit=options["limit"], view=options["view"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        if not results:
+            self.stdout.write("No query statistics, is API_QUERY_STATS enabled?")
+            return
+
+        header = f"{'count':>8} {'total ms':>10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rows':>8}"
+
+        for result in results:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{result['method']} {result['view']}"))
+            self.stdout.write(header)
+            self.stdout.write(
+                f"{result['count']:>8} {result['total'] * 1000:>10.2f} {result['mean'] * 1000:>9.2f} "
+                f"{result['p50'] * 1000:>9.2f} {result['p95'] * 1000:>9.2f} {result['p99'] * 1000:>9.2f} "
+                f"{result['rows']:>8}"
+            )
+            self.stdout.write(f"{result['sql']}\n")
@@ -1,18 +1,41 @@
 from abc import ABC
 
 from rest_framework import serializers
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
-
+from rest_framework.relations import MANY_RELATION_KWARGS, PKOnlyObject
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connections, models
+from django.db.models import Prefetch
+from django.db.models.signals import post_save, pre_save
+from django.utils import timezone
+
+from operator import attrgetter
+from types import MappingProxyType
 from typing import Callable
 
 from . import Message, Exception
 from .db.models import SmartModel
+from .db import versions
+
+
+class LoadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    A PrimaryKeyRelatedField reading the objects loaded for a list of items before querying them, the primary key
+    related fields of BaseModelSerializer(many=True) become one when validating, see
+    'BaseModelSerializer.load_related'.
+    """
+    loaded = None
+
+    def to_internal_value(self, data):
+        instance = _get_loaded(self, data)
+
+        if instance is not None:
+            return instance
+
+        return super().to_internal_value(data)
 
 
 class BaseModelSerializer(serializers.ModelSerializer):
 
-    nested_relations = []
     nested_relation = False
 
     related_name = None
@@ -22,76 +45,224 @@ class BaseModelSerializer(serializers.ModelSerializer):
     model_name_in_related_object = None
     ordered = False
     create_before_model = False
+    batched = False
 
     allow_null = False
 
+    # render each instance with a row function compiled from the fields, see 'compile_representation', and with
+    # 'compiled_values' read the page straight from values_list() when every field is a plain column
+    compiled_representation = False
+    compiled_values = False
+
+    # derive select_related and Prefetch(...) from the fields when no related fields are hand-written, and with
+    # 'optimise_only' restrict the columns loaded to the ones the fields read: anything else reading the instance
+    # (a model property, a view hook) then costs one query per row
+    auto_optimise = True
+    optimise_only = False
+
     def __init__(self, *args, nested_relation=False, related_name: str = None, foreign_key: str = None,
                  create_serializer: type(serializers.ModelSerializer) = None,
                  edit_serializer: type(serializers.ModelSerializer) = None,
                  model_name_in_related_object: str = None, ordered: bool = True, create_before_model=False,
-                 **kwargs):
+                 batched: bool = False, fields: [str] = None, exclude: [str] = None, **kwargs):
         self.related_name = related_name
         self.foreign_key = foreign_key
         self.create_serializer = create_serializer
         self.edit_serializer = edit_serializer
-        self.nested_relations = []
         self.nested_relation = nested_relation
         self.model_name_in_related_object = model_name_in_related_object
         self.ordered = ordered
         self.create_before_model = create_before_model
+        self.batched = batched
 
         self.allow_null = kwargs.get("allow_null", False)
 
         super().__init__(*args, **kwargs)
 
+        if nested_relation:
+            if not create_serializer:
+                self.raise_validation_error("create_serializer", self.get_nested_relation_error())
+
+            if not edit_serializer:
+                self.raise_validation_error("edit_serializer", self.get_nested_relation_error())
+
+            if not related_name:
+                self.raise_validation_error("field_name", self.get_nested_relation_error())
+
+        # sparse fieldsets e.g. fields=["id", "user.name"], only used to render
+        if fields or exclude:
+            self.nested_relations = self.get_nested_relations()
+            prune_fields(self, parse_field_paths(fields), parse_field_paths(exclude))
+
+    def get_nested_relation_error(self):
         try:
             field_def = str(self).split(":\n")[0]
         except:
             field_def = "ModelSerializer"
 
-        if nested_relation:
-            error = f"keyword must be specified if 'nested_relation' is true in {field_def}"
-            if not create_serializer:
-                self.raise_validation_error("create_serializer", error)
+        return f"keyword must be specified if 'nested_relation' is true in {field_def}"
 
-            if not edit_serializer:
-                self.raise_validation_error("edit_serializer", error)
+    @property
+    def nested_relations(self):
+        """
+        The nested relations of the serializer's fields, read-only and computed on first use as they're only
+        needed to write: rendering doesn't build the fields for them. They're read from this serializer's own
+        fields, so fields that depend on the context or on the init kwargs are taken into account.
+        """
+        nested_relations = self.__dict__.get("_nested_relations")
 
-            if not related_name:
-                self.raise_validation_error("field_name", error)
+        if nested_relations is None:
+            nested_relations = self._nested_relations = self.get_nested_relations()
+
+        return nested_relations
+
+    @nested_relations.setter
+    def nested_relations(self, nested_relations):
+        self._nested_relations = nested_relations
+
+    def get_nested_relations(self):
+        return _get_nested_relations(self.fields)
+
+    def to_representation(self, instance):
+        if not self.compiled_representation:
+            return super().to_representation(instance)
+
+        row = self.__dict__.get("_row")
+        if row is None:
+            row = self._row = compile_representation(self)
+
+        return row(instance)
+
+    def get_values_queryset(self, queryset):
+        """
+        The queryset as values_list() tuples of the fields' columns, for 'represent_values', or None when a field
+        needs the model instance.
+        """
+        columns = get_values_columns(self)
+
+        if columns is None:
+            return None
+
+        return queryset.select_related(None).prefetch_related(None).defer(None).values_list(*columns)
+
+    def represent_values(self, rows) -> list:
+        """
+        The representation of the 'get_values_queryset' rows, identical to the representation of the instances.
+        """
+        plan = _get_values_plan(self)
+
+        return [
+            {name: None if value is None else convert(value) for (name, convert), value in zip(plan, row)}
+            for row in rows
+        ]
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_serializer = super().many_init(*args, **kwargs)
+
+        # no list_serializer_class in Meta, use the one loading the instances in bulk
+        if type(list_serializer) is serializers.ListSerializer:
+            list_serializer.__class__ = BaseModelListSerializer
+
+        return list_serializer
+
+    def load_instances(self, data: [dict]):
+        """
+        Loads the instances of the items with an 'id' with one in_bulk query, before they are validated one by one
+        by 'to_internal_value'. The instances are kept in 'instances', by primary key, and reused to write them in
+        'update_foreign_key_relation'.
+
+        The instances of the items' nested many relations are loaded at the same time, for all the items, so they
+        are kept for every item of the list and not only for the last one validated.
+        """
+        for field in self.fields.values():
+            child = getattr(field, "child", None)
+
+            if field.read_only or not isinstance(field, BaseModelListSerializer) or \
+                    not isinstance(child, BaseModelSerializer):
+                continue
+
+            nested_data = []
+            for item in data:
+                values = item.get(field.field_name) if isinstance(item, dict) else None
+
+                if isinstance(values, list):
+                    nested_data.extend(values)
+
+            child.load_instances(nested_data)
+
+        if not self.edit_serializer:
+            return
+
+        pk_field = self.Meta.model._meta.pk
+        instances = self.__dict__.get("instances") or {}
 
-        nested_relations = []
-        for _nested_field in self.get_fields():
-            many = False
+        ids = set()
+        for item in data:
+            if isinstance(item, dict) and item.get("id") is not None:
+                try:
+                    ids.add(pk_field.to_python(item["id"]))
+                except DjangoValidationError:
+                    pass
 
-            _nested_serializer_field = self.fields[_nested_field]
-            if not hasattr(_nested_serializer_field, "related_name") or not _nested_serializer_field.related_name:
-                # if many=True data will be in child serializer
-                _nested_serializer_field = getattr(_nested_serializer_field, "child", None)
-                if not hasattr(_nested_serializer_field, "related_name") or not _nested_serializer_field.related_name:
+        # the ones already loaded with the list of a parent serializer are kept
+        ids.difference_update(instances)
+
+        if ids:
+            instances.update(self.Meta.model.objects.in_bulk(list(ids)))
+
+        self.instances = instances
+
+    def load_related(self, data: [dict]):
+        """
+        Loads the objects of the primary key related fields for all the items with one in_bulk query per field,
+        before they are validated one by one.
+        """
+        for field in self.fields.values():
+            relation = getattr(field, "child_relation", field)
+
+            if type(relation) is serializers.PrimaryKeyRelatedField:
+                relation.__class__ = LoadedPrimaryKeyRelatedField
+
+            if field.read_only or not hasattr(relation, "loaded") or relation.pk_field is not None:
+                continue
+
+            queryset = relation.get_queryset()
+            pk_field = queryset.model._meta.pk
+
+            ids = set()
+            for item in data:
+                values = item.get(field.field_name) if isinstance(item, dict) else None
+
+                if values is None:
                     continue
-                else:
-                    many = True
-
-            if _nested_serializer_field.nested_relation:
-                nested_relations.append({
-                    "foreign_key": _nested_serializer_field.foreign_key,
-                    "related_name": _nested_serializer_field.related_name or _nested_serializer_field.field_name,
-                    "create_serializer": _nested_serializer_field.create_serializer,
-                    "edit_serializer": _nested_serializer_field.edit_serializer,
-                    "many": many,
-                    "allow_null": _nested_serializer_field.allow_null,
-                    "model_name_in_related_object": _nested_serializer_field.model_name_in_related_object,
-                    "ordered": _nested_serializer_field.ordered,
-                    "create_before_model": _nested_serializer_field.create_before_model
-                })
-
-        self.nested_relations = nested_relations
+
+                for value in (values if relation is not field and isinstance(values, list) else [values]):
+                    try:
+                        ids.add(pk_field.to_python(value))
+                    except (DjangoValidationError, TypeError):
+                        pass
+
+            relation.loaded = queryset.in_bulk(list(ids)) if ids else None
+
+    def get_instance(self, pk):
+        instances = self.__dict__.get("instances")
+
+        if instances:
+            try:
+                instance = instances.get(self.Meta.model._meta.pk.to_python(pk))
+            except DjangoValidationError:
+                instance = None
+
+            if instance is not None:
+                return instance
+
+        return self.Meta.model.objects.get(id=pk)
 
     def to_internal_value(self, data):
         validated_data = super(BaseModelSerializer, self).to_internal_value(data)
         if "id" in data and self.edit_serializer:
-            instance = self.Meta.model.objects.get(id=data["id"])
+            instance = self.get_instance(data["id"])
 
             # use original data to avoid double validation
             serializer = self.edit_serializer(data=data, instance=instance, partial=True)
@@ -108,15 +279,47 @@ class BaseModelSerializer(serializers.ModelSerializer):
 
 
     @classmethod
-    def optimise(cls, queryset):
+    def optimise(cls, queryset, fields: [str] = None, exclude: [str] = None):
+        """
+        Applies the serializer's select_related/prefetch_related fields. With a sparse fieldset, relations that
+        none of the remaining fields read are dropped and the model fields that were pruned are deferred.
+
+        When neither is hand-written (and 'auto_optimise' is set) they are derived from the fields instead,
+        see 'get_query_plan', along with only() the columns the fields read if 'optimise_only' is set.
+        """
         select_related_fields = cls.get_select_related_fields()
+        prefetch_related_fields = cls.get_prefetch_related_fields()
+        deferred_fields = []
+
+        if cls.auto_optimise and not select_related_fields and not prefetch_related_fields:
+            plan = get_query_plan(cls(fields=fields, exclude=exclude), queryset.model)
+            queryset = apply_query_plan(queryset, plan, only=cls.optimise_only)
+
+            if cls.optimise_only:
+                return queryset
+
+        if fields or exclude:
+            sources = get_sparse_sources(cls, fields, exclude)
+
+            if sources is not None:
+                used, pruned = sources
+
+                select_related_fields = [path for path in select_related_fields
+                                         if path.split("__")[0] in used]
+                prefetch_related_fields = [lookup for lookup in prefetch_related_fields
+                                           if _get_prefetch_path(lookup).split("__")[0] in used]
+
+                deferred_fields = get_deferrable_fields(queryset.model, pruned)
+
         if len(select_related_fields) > 0:
             queryset = queryset.select_related(*select_related_fields)
 
-        prefetch_related_fields = cls.get_prefetch_related_fields()
         if len(prefetch_related_fields) > 0:
             queryset = queryset.prefetch_related(*prefetch_related_fields)
 
+        if len(deferred_fields) > 0:
+            queryset = queryset.defer(*deferred_fields)
+
         return queryset
 
     def raise_validation_error(self, key=None, error=None):
@@ -161,7 +364,7 @@ class BaseModelSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         updatable_nested_relations = []
         for nested_relation in self.nested_relations:
-            nested_relation["data"] = validated_data.pop(nested_relation["related_name"], None)
+            nested_relation = {**nested_relation, "data": validated_data.pop(nested_relation["related_name"], None)}
 
             if nested_relation["data"] is None and nested_relation["allow_null"] is False:
                 self.raise_validation_error(nested_relation["related_name"], "was not resolvable 'create'")
@@ -189,7 +392,7 @@ class BaseModelSerializer(serializers.ModelSerializer):
     def update(self, model, validated_data):
         updatable_nested_relations = []
         for nested_relation in self.nested_relations:
-            nested_relation["data"] = validated_data.pop(nested_relation["related_name"], None)
+            nested_relation = {**nested_relation, "data": validated_data.pop(nested_relation["related_name"], None)}
 
             if nested_relation["create_before_model"]:
                 self.raise_validation_error(nested_relation["related_name"], "'create_before_model' not supported on Edit")
@@ -227,7 +430,9 @@ class BaseModelSerializer(serializers.ModelSerializer):
                     related_name=related_name,
                     related_object_create_serializer=create_serializer,
                     related_object_edit_serializer=edit_serializer,
-                    ordered=nested_relation["ordered"]
+                    ordered=nested_relation["ordered"],
+                    batched=nested_relation["batched"],
+                    instances=self.get_nested_instances(nested_relation)
                 )
             else:
                 nested_relation = update_one_to_one_relation(
@@ -243,6 +448,15 @@ class BaseModelSerializer(serializers.ModelSerializer):
 
         return nested_relations
 
+    def get_nested_instances(self, nested_relation) -> dict:
+        """
+        :return: The instances of a many nested relation loaded during the validation, by primary key
+        """
+        field = self.fields.get(nested_relation["field_name"])
+        child = getattr(field, "child", None)
+
+        return child.__dict__.get("instances") if child is not None else None
+
     def handle_create(self, validated_data):
         return super().create(validated_data)
 
@@ -352,6 +566,19 @@ class ListSerializer(BaseSerializer):
         raise Exception.raise_error(Message.create("Validate Serializer does not support 'update'"))
 
 
+class BaseModelListSerializer(serializers.ListSerializer):
+    """
+    The list serializer of BaseModelSerializer(many=True), see 'BaseModelSerializer.load_instances'.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and isinstance(self.child, BaseModelSerializer):
+            self.child.load_instances(data)
+            self.child.load_related(data)
+
+        return super().to_internal_value(data)
+
+
 class OrderedListSerializer(serializers.ListSerializer, ABC):
 
     def to_representation(self, data):
@@ -397,13 +624,461 @@ class ValidateModelSerializer(BaseModelSerializer):
         raise Exception.raiseError(Message.create("Validate Model Serializer does not support 'update'"))
 
 
+def _get_nested_relations(fields) -> tuple:
+    nested_relations = []
+
+    for field_name, field in fields.items():
+        many = False
+
+        if not hasattr(field, "related_name") or not field.related_name:
+            # if many=True data will be in child serializer
+            field = getattr(field, "child", None)
+            if not hasattr(field, "related_name") or not field.related_name:
+                continue
+            else:
+                many = True
+
+        if field.nested_relation:
+            nested_relations.append(MappingProxyType({
+                "foreign_key": field.foreign_key,
+                "related_name": field.related_name or field.field_name,
+                "create_serializer": field.create_serializer,
+                "edit_serializer": field.edit_serializer,
+                "many": many,
+                "allow_null": field.allow_null,
+                "model_name_in_related_object": field.model_name_in_related_object,
+                "ordered": field.ordered,
+                "create_before_model": field.create_before_model,
+                "batched": field.batched,
+                "field_name": field_name
+            }))
+
+    return tuple(nested_relations)
+
+
+def compile_representation(serializer: serializers.Serializer) -> Callable:
+    """
+    Builds the row function of the serializer's fields: plain model columns and foreign key ids are read with
+    attrgetter and converted with a known converter, any other field goes through its own 'get_attribute' and
+    'to_representation' as in Serializer.to_representation. The output is identical to the standard path,
+    see 'compare_representations'.
+
+    The columns and converters are resolved once per serializer class and set of fields (see
+    '_get_representation_plan'), only the other fields are bound to the serializer's own field instances.
+    """
+    steps = []
+
+    for field, (name, get, convert) in zip(serializer._readable_fields, _get_representation_plan(serializer)):
+        if get is not None:
+            steps.append((name, get, convert or field.to_representation, False))
+        else:
+            steps.append((name, field.get_attribute, field.to_representation, True))
+
+    def row(instance):
+        ret = {}
+
+        for name, get, convert, generic in steps:
+            if not generic:
+                value = get(instance)
+                ret[name] = None if value is None else convert(value)
+                continue
+
+            try:
+                attribute = get(instance)
+            except serializers.SkipField:
+                continue
+
+            check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+            ret[name] = None if check_for_none is None else convert(attribute)
+
+        return ret
+
+    return row
+
+
+def get_values_columns(serializer: serializers.Serializer) -> [str]:
+    """
+    :return: The columns of the serializer's fields, or None if a field isn't a plain column or foreign key id
+    """
+    columns = []
+
+    for field in serializer._readable_fields:
+        column = _get_column(serializer, field)
+
+        if column is None:
+            return None
+
+        columns.append(column)
+
+    return columns
+
+
+def compare_representations(serializer_class, instances, **kwargs) -> list:
+    """
+    Renders the instances with the standard and the compiled representation e.g. in a project's tests.
+
+    :return: (index, standard, compiled) of every instance whose representations differ
+    """
+    standard = type("Standard" + serializer_class.__name__, (serializer_class,), {"compiled_representation": False})
+    compiled = type("Compiled" + serializer_class.__name__, (serializer_class,), {"compiled_representation": True})
+
+    expected = standard(instances, many=True, **kwargs).data
+    actual = compiled(instances, many=True, **kwargs).data
+
+    return [(index, left, right) for index, (left, right) in enumerate(zip(expected, actual)) if left != right]
+
+
+def _get_values_plan(serializer):
+    return [(name, convert or field.to_representation)
+            for field, (name, get, convert) in zip(serializer._readable_fields, _get_representation_plan(serializer))]
+
+
+def _get_representation_plan(serializer):
+    """
+    (field name, attrgetter of the column or None, converter) of each readable field, cached on the serializer
+    class by the names, classes and sources of the fields so sparse fieldsets get their own plan. The converter
+    is None when it's the field's own 'to_representation', which is bound to each serializer's field instance.
+    """
+    fields = list(serializer._readable_fields)
+    key = tuple((field.field_name, type(field), field.source) for field in fields)
+
+    cls = type(serializer)
+    plans = cls.__dict__.get("_representation_plans")
+    if plans is None:
+        plans = cls._representation_plans = {}
+
+    plan = plans.get(key)
+    if plan is None:
+        plan = []
+        for field in fields:
+            column = _get_column(serializer, field)
+            plan.append((field.field_name, attrgetter(column), _get_converter(field)) if column is not None else
+                        (field.field_name, None, None))
+
+        plan = plans[key] = tuple(plan)
+
+    return plan
+
+
+def _get_column(serializer, field):
+    """
+    The attribute of the instance the field renders as is, a concrete column or a foreign key id, or None.
+    """
+    model = getattr(getattr(serializer, "Meta", None), "model", None)
+
+    if model is None or len(field.source_attrs) != 1:
+        return None
+
+    try:
+        model_field = model._meta.get_field(field.source_attrs[0])
+    except FieldDoesNotExist:
+        return None
+
+    if not model_field.concrete:
+        return None
+
+    field_class = type(field)
+
+    if model_field.is_relation:
+        is_pk_field = isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None and \
+            field_class.get_attribute is serializers.RelatedField.get_attribute and \
+            field_class.to_representation is serializers.PrimaryKeyRelatedField.to_representation and \
+            field.use_pk_only_optimization()
+
+        return model_field.attname if is_pk_field and model_field.many_to_one else None
+
+    if field_class.get_attribute is not serializers.Field.get_attribute or \
+            isinstance(field, (serializers.BaseSerializer, serializers.RelatedField)):
+        return None
+
+    return model_field.attname
+
+
+def _get_converter(field):
+    """
+    :return: The converter of a column field's values, or None to use the field's 'to_representation'
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        return _identity
+
+    return _CONVERTERS.get(type(field))
+
+
+def _identity(value):
+    return value
+
+
+_CONVERTERS = {
+    serializers.CharField: str,
+    serializers.IntegerField: int,
+}
+
+
+def parse_field_paths(paths: [str]) -> dict:
+    """
+    ["id", "user.name", "user.email"] -> {"id": {}, "user": {"name": {}, "email": {}}}
+    """
+    tree = {}
+    for path in paths or []:
+        node = tree
+        for part in path.split("."):
+            node = node.setdefault(part, {})
+
+    return tree
+
+
+def prune_fields(serializer: serializers.BaseSerializer, fields: dict = None, exclude: dict = None):
+    """
+    Removes the fields of a serializer (and of its nested serializers) that aren't in 'fields' or are in 'exclude'.
+
+    :param fields: A tree of the field names to keep, see 'parse_field_paths'. A name without children keeps
+    the whole field
+    :param exclude: A tree of the field names to remove. A name without children removes the whole field
+    """
+    serializer_fields = serializer.fields
+
+    for name in list(serializer_fields):
+        if fields and name not in fields:
+            serializer_fields.pop(name)
+            continue
+
+        if exclude and name in exclude and not exclude[name]:
+            serializer_fields.pop(name)
+            continue
+
+        nested_fields = fields.get(name) if fields else None
+        nested_exclude = exclude.get(name) if exclude else None
+
+        if nested_fields or nested_exclude:
+            nested_serializer = _get_nested_serializer(serializer_fields[name])
+
+            if nested_serializer is not None:
+                prune_fields(nested_serializer, nested_fields, nested_exclude)
+
+
+def get_sparse_sources(serializer_class, fields: [str] = None, exclude: [str] = None):
+    """
+    :return: The first part of the sources of the remaining fields and the sources of the pruned fields,
+    or None if the remaining fields could read anything (a method field, source='*' or an overridden
+    to_representation)
+    """
+    serializer = serializer_class()
+
+    if _overrides_representation(serializer):
+        return None
+
+    all_fields = serializer.fields
+    remaining_fields = serializer_class(fields=fields, exclude=exclude).fields
+
+    used = set()
+    for field in remaining_fields.values():
+        if isinstance(field, serializers.SerializerMethodField) or field.source == "*":
+            return None
+
+        used.add(field.source.split(".")[0])
+
+    pruned = [field.source for name, field in all_fields.items() if name not in remaining_fields]
+
+    return used, [source for source in pruned if source not in used]
+
+
+def get_deferrable_fields(model, sources: [str]) -> [str]:
+    """
+    :return: The sources that are concrete model fields which can be deferred
+    """
+    deferrable = []
+
+    for source in sources:
+        if "." in source or source == "*":
+            continue
+
+        try:
+            field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            continue
+
+        if field.concrete and not field.primary_key and not field.many_to_many:
+            deferrable.append(source)
+
+    return deferrable
+
+
+def get_query_plan(serializer: serializers.BaseSerializer, model: type(models.Model)) -> dict:
+    """
+    Walks the readable fields of the serializer, including nested serializers, 'source' dotted paths and
+    many=True children, and collects what the serialization reads from the database.
+
+    :return: The 'select_related' paths, the 'prefetch_related' lookups (Prefetch objects with their own
+    optimised queryset for nested serializers) and the 'only' columns
+    """
+    plan = {"select_related": [], "prefetch_related": [], "only": set()}
+    _walk_serializer(serializer, model, "", plan)
+
+    return plan
+
+
+def apply_query_plan(queryset, plan: dict, only: bool = True):
+    if plan["select_related"]:
+        queryset = queryset.select_related(*plan["select_related"])
+
+    if plan["prefetch_related"]:
+        queryset = queryset.prefetch_related(*plan["prefetch_related"])
+
+    if only and plan["only"]:
+        queryset = queryset.only(*sorted(plan["only"]))
+
+    return queryset
+
+
+def _walk_serializer(serializer, model, prefix, plan):
+    plan["only"].add(f"{prefix}{model._meta.pk.name}")
+
+    # an overridden to_representation can read anything on the instance
+    if _overrides_representation(serializer):
+        _add_all_columns(model, prefix, plan)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        nested_serializer = _get_nested_serializer(field)
+
+        if field.source == "*":
+            if nested_serializer is not None:
+                _walk_serializer(nested_serializer, model, prefix, plan)
+            else:
+                _add_all_columns(model, prefix, plan)
+            continue
+
+        # a method can read anything on the instance
+        if isinstance(field, serializers.SerializerMethodField):
+            _add_all_columns(model, prefix, plan)
+            continue
+
+        _walk_source(field, nested_serializer, field.source.split("."), model, prefix, plan)
+
+
+def _walk_source(field, nested_serializer, parts, model, prefix, plan):
+    part, rest = parts[0], parts[1:]
+
+    try:
+        model_field = model._meta.get_field(part)
+    except FieldDoesNotExist:
+        # a property or a method, it can read anything on the instance
+        _add_all_columns(model, prefix, plan)
+        return
+
+    path = f"{prefix}{part}"
+
+    if not model_field.is_relation:
+        plan["only"].add(f"{prefix}{model_field.name}")
+        return
+
+    related_model = model_field.related_model
+
+    if related_model is None:
+        _add_all_columns(model, prefix, plan)
+        return
+
+    if model_field.many_to_many or model_field.one_to_many:
+        if nested_serializer is not None and not rest:
+            queryset = _get_prefetch_queryset(nested_serializer, related_model, model_field)
+            plan["prefetch_related"].append(Prefetch(path, queryset=queryset))
+        elif path not in plan["prefetch_related"]:
+            plan["prefetch_related"].append(path)
+        return
+
+    if model_field.concrete:
+        plan["only"].add(f"{prefix}{model_field.name}")
+
+        # only the foreign key column is needed to render the related pk
+        if not rest and isinstance(field, serializers.PrimaryKeyRelatedField):
+            return
+    else:
+        plan["only"].add(f"{path}__{model_field.field.name}")
+
+    if path not in plan["select_related"]:
+        plan["select_related"].append(path)
+
+    if rest:
+        _walk_source(field, nested_serializer, rest, related_model, f"{path}__", plan)
+    elif nested_serializer is not None:
+        _walk_serializer(nested_serializer, related_model, f"{path}__", plan)
+    else:
+        # e.g. a StringRelatedField, str() can read anything on the related instance
+        _add_all_columns(related_model, f"{path}__", plan)
+
+
+def _get_prefetch_queryset(nested_serializer, related_model, model_field):
+    queryset = related_model._default_manager.all()
+
+    nested_serializer_class = type(nested_serializer)
+
+    # hand-written related fields of the nested serializer win
+    if isinstance(nested_serializer, BaseModelSerializer) and \
+            (nested_serializer_class.get_select_related_fields() or
+             nested_serializer_class.get_prefetch_related_fields()):
+        return nested_serializer_class.optimise(queryset)
+
+    plan = {"select_related": [], "prefetch_related": [], "only": set()}
+    _walk_serializer(nested_serializer, related_model, "", plan)
+
+    # the prefetch matches the related objects to their parent with the foreign key
+    if model_field.one_to_many:
+        plan["only"].add(model_field.field.name)
+
+    only = getattr(nested_serializer_class, "optimise_only", False)
+
+    return apply_query_plan(queryset, plan, only=only)
+
+
+def _overrides_representation(serializer) -> bool:
+    return type(serializer).to_representation not in (BaseModelSerializer.to_representation,
+                                                      serializers.Serializer.to_representation)
+
+
+def _add_all_columns(model, prefix, plan):
+    for field in model._meta.concrete_fields:
+        plan["only"].add(f"{prefix}{field.name}")
+
+
+def _get_nested_serializer(field):
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+
+    return field if isinstance(field, serializers.BaseSerializer) else None
+
+
+def _get_prefetch_path(lookup) -> str:
+    return lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+
+
 # https://github.com/encode/django-rest-framework/issues/6599
 # returns the original pk instead of the object
 class PrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
 
+    default_error_messages = {
+        'does_not_exist_many': 'Invalid pks {pk_values} - objects do not exist.',
+    }
+
+    # the most pks looked up per query with many=True
+    chunk_size = 2000
+
+    loaded = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return ManyPrimaryKeyRelatedField(**list_kwargs)
+
     def to_internal_value(self, data):
         if self.pk_field is not None:
             data = self.pk_field.to_internal_value(data)
+        if _get_loaded(self, data) is not None:
+            return data
         try:
             self.get_queryset().get(pk=data)
         except ObjectDoesNotExist:
@@ -413,6 +1088,74 @@ class PrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
         else:
             return data
 
+    def to_internal_value_many(self, data) -> list:
+        """
+        Validates a list of pks with one filter(pk__in=...) query per 'chunk_size' pks, the pks that do not
+        exist are reported in one error.
+
+        :return: The original pks
+        """
+        if self.pk_field is not None:
+            data = [self.pk_field.to_internal_value(item) for item in data]
+        else:
+            data = list(data)
+
+        queryset = self.get_queryset()
+        pk_field = queryset.model._meta.pk
+
+        values = []
+        for item in data:
+            try:
+                values.append(pk_field.get_prep_value(item))
+            except (TypeError, ValueError):
+                self.fail('incorrect_type', data_type=type(item).__name__)
+
+        loaded = self.loaded or {}
+        unique_values = [value for value in dict.fromkeys(values) if value not in loaded]
+
+        max_query_params = connections[queryset.db].features.max_query_params
+        chunk_size = min(self.chunk_size, max_query_params) if max_query_params else self.chunk_size
+
+        existing = set(loaded)
+        for start in range(0, len(unique_values), chunk_size):
+            existing.update(queryset.filter(pk__in=unique_values[start:start + chunk_size]).values_list("pk", flat=True))
+
+        missing = list({value: item for item, value in zip(data, values) if value not in existing}.values())
+
+        if len(missing) == 1:
+            self.fail('does_not_exist', pk_value=missing[0])
+
+        if missing:
+            self.fail('does_not_exist_many', pk_values=", ".join(f'"{item}"' for item in missing))
+
+        return data
+
+
+class ManyPrimaryKeyRelatedField(serializers.ManyRelatedField):
+    """
+    PrimaryKeyRelatedField(many=True), validating all the pks at once, see
+    'PrimaryKeyRelatedField.to_internal_value_many'.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        return self.child_relation.to_internal_value_many(data)
+
+
+def _get_loaded(field, data):
+    if not field.loaded:
+        return None
+
+    try:
+        pk_field = next(iter(field.loaded.values()))._meta.pk
+        return field.loaded.get(pk_field.to_python(data))
+    except (DjangoValidationError, TypeError):
+        return None
+
 
 def update_one_to_one_relation(model: SmartModel, related_model_data: dict, related_name: str,
                                model_name_in_related_object: str,
@@ -469,7 +1212,7 @@ def update_foreign_key_relation(model: SmartModel, foreign_key: str,
                                 related_object_edit_serializer: type(serializers.ModelSerializer),
                                 related_object_primary_key: str = "id",
                                 ordered: bool = True, order_name: str = "order",
-                                return_on_null: bool = True):
+                                return_on_null: bool = True, batched: bool = False, instances: dict = None):
     """
     This method is a util method that updates a model's related objects. It will delete any relations not provided
 
@@ -483,6 +1226,10 @@ def update_foreign_key_relation(model: SmartModel, foreign_key: str,
     :param ordered: Whether the related models are to be ordered
     :param order_name: The name of the order field in the related model
     :param return_on_null: If the method should return without updating the relation if null data is passed
+    :param batched: Write the related objects with bulk_update/bulk_create instead of a save() per object, see
+    'update_foreign_key_relation_batched'. Falls back to a save() per object when the serializers have hooks or
+    the model has pre_save/post_save receivers
+    :param instances: The related objects already loaded, by primary key e.g. during the validation
     :return: An array of the related models
     """
     related_objects = []
@@ -494,6 +1241,15 @@ def update_foreign_key_relation(model: SmartModel, foreign_key: str,
 
         related_objects_data = []
 
+    if batched and _is_batchable(related_object_create_serializer, related_object_edit_serializer):
+        return update_foreign_key_relation_batched(
+            model=model, foreign_key=foreign_key, related_objects_data=related_objects_data,
+            model_name_in_related_object=model_name_in_related_object, related_name=related_name,
+            related_object_model=related_object_create_serializer.Meta.model,
+            related_object_primary_key=related_object_primary_key, ordered=ordered, order_name=order_name,
+            instances=instances
+        )
+
     for related_object_data in related_objects_data:
         if related_object_primary_key in related_object_data:
             related_object_ids.append(related_object_data[related_object_primary_key])
@@ -518,7 +1274,9 @@ def update_foreign_key_relation(model: SmartModel, foreign_key: str,
         if related_object_primary_key in related_object_data:
             pk = related_object_data[related_object_primary_key]
             related_object_model = related_object_create_serializer.Meta.model
-            related_object = related_object_model.objects.get(**{related_object_primary_key: pk})
+            related_object = _get_loaded_instance(instances, related_object_model, related_object_primary_key, pk)
+            if related_object is None:
+                related_object = related_object_model.objects.get(**{related_object_primary_key: pk})
             serializer = related_object_edit_serializer(data=related_object_data, instance=related_object)
             related_object = serializer.update(related_object, related_object_data)
         else:
@@ -528,3 +1286,321 @@ def update_foreign_key_relation(model: SmartModel, foreign_key: str,
         related_objects.append(related_object)
 
     return related_objects
+
+
+def update_foreign_key_relation_batched(model: SmartModel, foreign_key: str, related_objects_data: [dict],
+                                        model_name_in_related_object: str, related_name: str,
+                                        related_object_model: type(models.Model),
+                                        related_object_primary_key: str = "id",
+                                        ordered: bool = True, order_name: str = "order", instances: dict = None):
+    """
+    The batched 'update_foreign_key_relation': the existing related objects are loaded with one in_bulk query,
+    compared to the data in memory and only the changed ones are written, with one bulk_update of the changed
+    fields (the order included), the new ones are written with one bulk_create. The serializers' create/update
+    and the models' save() are not called, so neither are the pre_save/post_save receivers, the related objects
+    not provided are soft deleted as before. With the 'instances' loaded during the validation, no query is
+    needed when they all belong to the model.
+
+    :return: An array of the related models
+    """
+    opts = related_object_model._meta
+
+    # the ids of the data e.g. "5" are compared to the in_bulk keys as the primary key field's python values
+    key_field = opts.pk if related_object_primary_key == "pk" else opts.get_field(related_object_primary_key)
+    not_owned_error = {
+        related_name: f"One or more {related_name} does not belong to this {model_name_in_related_object}"
+    }
+
+    try:
+        related_object_ids = [
+            key_field.to_python(related_object_data[related_object_primary_key])
+            for related_object_data in related_objects_data if related_object_primary_key in related_object_data
+        ]
+    except DjangoValidationError:
+        raise Exception.raise_error(not_owned_error, status_code=400)
+
+    related_field_name = foreign_key or related_name
+    if hasattr(model, related_field_name):
+        related_manager = getattr(model, related_field_name)
+
+        existing = _get_owned_instances(instances, related_manager, related_object_model, related_object_primary_key,
+                                        related_object_ids)
+        if existing is None:
+            existing = related_manager.in_bulk(related_object_ids, field_name=related_object_primary_key)
+
+        if len(existing) != len(set(related_object_ids)):
+            raise Exception.raise_error(not_owned_error, status_code=400)
+
+        related_manager.exclude(**{f"{related_object_primary_key}__in": related_object_ids}).delete()
+    else:
+        existing = related_object_model.objects.in_bulk(related_object_ids, field_name=related_object_primary_key)
+
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    auto_now_fields = [field for field in fields if getattr(field, "auto_now", False)]
+
+    related_objects = []
+    changed_objects = []
+    changed_fields = set()
+    created_objects = []
+    many_to_many = []
+
+    now = timezone.now()
+
+    for index, related_object_data in enumerate(related_objects_data, start=0):
+        if ordered:
+            related_object_data[order_name] = index
+
+        related_object_data[model_name_in_related_object] = model
+        related_object_data["deleted_at"] = None
+
+        values = dict(related_object_data)
+        relations = {
+            name: values.pop(name) for name in list(values)
+            if name in opts._forward_fields_map and opts._forward_fields_map[name].many_to_many
+        }
+
+        if related_object_primary_key in values:
+            related_object = existing[key_field.to_python(values.pop(related_object_primary_key))]
+
+            previous = [getattr(related_object, field.attname) for field in fields]
+
+            for name, value in values.items():
+                setattr(related_object, name, value)
+
+            changed = {
+                field.name for field, value in zip(fields, previous) if getattr(related_object, field.attname) != value
+            }
+
+            if changed:
+                for field in auto_now_fields:
+                    setattr(related_object, field.attname, now)
+                    changed.add(field.name)
+
+                changed_objects.append(related_object)
+                changed_fields |= changed
+        else:
+            related_object = related_object_model(**values)
+            created_objects.append(related_object)
+
+        if relations:
+            many_to_many.append((related_object, relations))
+
+        related_objects.append(related_object)
+
+    if changed_objects:
+        related_object_model._default_manager.bulk_update(changed_objects, [
+            field.name for field in fields if field.name in changed_fields
+        ])
+
+    if created_objects:
+        related_object_model._default_manager.bulk_create(created_objects)
+
+    for related_object, relations in many_to_many:
+        for name, value in relations.items():
+            getattr(related_object, name).set(value)
+
+    return related_objects
+
+
+def _is_batchable(create_serializer, edit_serializer) -> bool:
+    """
+    Whether the nested objects can be written in bulk i.e. the serializers only write their own fields: no
+    nested relations and no create/update hooks overridden, and no pre_save/post_save receivers of the model
+    would be skipped.
+    """
+    for serializer, methods in ((create_serializer, _CREATE_METHODS), (edit_serializer, _UPDATE_METHODS)):
+        if not _is_bulk_writable(serializer, methods):
+            return False
+
+        if serializer().nested_relations:
+            return False
+
+    return not _has_save_receivers(create_serializer.Meta.model)
+
+
+def _has_save_receivers(model) -> bool:
+    # bulk_create/bulk_update don't send pre_save/post_save
+    return pre_save.has_listeners(model) or post_save.has_listeners(model)
+
+
+_CREATE_METHODS = ("create", "handle_create", "post_create")
+_UPDATE_METHODS = ("update", "handle_update", "post_update")
+
+
+def _is_bulk_writable(serializer, methods) -> bool:
+    if not issubclass(serializer, BaseModelSerializer):
+        return False
+
+    if any(getattr(serializer, method) is not getattr(BaseModelSerializer, method) for method in methods):
+        return False
+
+    # bulk_create/bulk_update don't call save()
+    save = serializer.Meta.model.save
+    return save is SmartModel.save or save is models.Model.save
+
+
+def bulk_create_instances(serializer_class: type(BaseModelSerializer), validated_data: [dict],
+                          batch_size: int = 1000) -> [SmartModel]:
+    """
+    Creates the instances of the validated data (of 'serializer_class'(many=True)) with bulk_create, 'batch_size'
+    rows per INSERT. The primary keys are generated before the insert by the field's default e.g. CharIDField, the
+    many to many relations are added with one bulk_create per relation and the nested many relations of every
+    instance are created with one bulk_create per relation, the other nested relations with the serializer's
+    'update_nested_relations'.
+
+    Serializers overriding create, handle_create or post_create, whose model overrides save() or has
+    pre_save/post_save receivers, or with 'create_before_model' relations create each instance with their 'create'
+    instead.
+
+    :return: The created instances, in the order of the data
+    """
+    serializer = serializer_class()
+    model_class = serializer_class.Meta.model
+
+    if not _is_bulk_writable(serializer_class, _CREATE_METHODS) or _has_save_receivers(model_class) or \
+            any(nested_relation["create_before_model"] for nested_relation in serializer.nested_relations):
+        return [serializer_class().create(dict(attrs)) for attrs in validated_data]
+
+    many_to_many_fields = {field.name: field for field in model_class._meta.many_to_many}
+
+    instances = []
+    many_to_many = []
+    nested_data = []
+
+    for attrs in validated_data:
+        attrs = dict(attrs)
+
+        nested = {}
+        for nested_relation in serializer.nested_relations:
+            data = attrs.pop(nested_relation["related_name"], None)
+
+            if data is None and nested_relation["allow_null"] is False:
+                serializer.raise_validation_error(nested_relation["related_name"], "was not resolvable 'create'")
+
+            nested[nested_relation["related_name"]] = data
+
+        many_to_many.append({name: attrs.pop(name) for name in many_to_many_fields if name in attrs})
+        instances.append(model_class(**attrs))
+        nested_data.append(nested)
+
+    model_class._default_manager.bulk_create(instances, batch_size=batch_size)
+
+    for name, field in many_to_many_fields.items():
+        _bulk_add_many_to_many(field, [
+            (instance, values[name]) for instance, values in zip(instances, many_to_many) if name in values
+        ], batch_size)
+
+    remaining_relations = []
+    for nested_relation in serializer.nested_relations:
+        related_name = nested_relation["related_name"]
+        data = [(instance, nested[related_name]) for instance, nested in zip(instances, nested_data)]
+
+        if not _bulk_create_nested_relation(nested_relation, data, batch_size):
+            remaining_relations.append(nested_relation)
+
+    for instance, nested in zip(instances, nested_data):
+        if not remaining_relations:
+            break
+
+        serializer.nested_relations = [
+            {**nested_relation, "data": nested[nested_relation["related_name"]]}
+            for nested_relation in remaining_relations
+        ]
+        serializer.update_nested_relations(instance)
+
+    return instances
+
+
+def _bulk_add_many_to_many(field, values: list, batch_size: int):
+    """
+    :param values: The (instance, related objects or pks) to add
+    """
+    through = field.remote_field.through
+
+    if not through._meta.auto_created:
+        for instance, related in values:
+            getattr(instance, field.name).set(related)
+        return
+
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+    through._default_manager.bulk_create([
+        through(**{source: instance.pk, target: getattr(value, "pk", value)})
+        for instance, related in values for value in dict.fromkeys(related)
+    ], batch_size=batch_size)
+
+    # the auto created through model isn't a SmartModel, its writes don't bump a version
+    versions.bump_on_write(field.related_model)
+
+
+def _bulk_create_nested_relation(nested_relation, data: list, batch_size: int) -> bool:
+    """
+    Creates the nested objects of a many relation for every (instance, nested data) with one bulk_create.
+
+    :return: False when the relation can't be created in bulk e.g. its serializer has nested relations or the data
+    has ids, it's then left to 'update_nested_relations'
+    """
+    create_serializer = nested_relation["create_serializer"]
+
+    if not nested_relation["many"] or \
+            not _is_batchable(create_serializer, nested_relation["edit_serializer"]):
+        return False
+
+    related_model = create_serializer.Meta.model
+    many_to_many_fields = {field.name for field in related_model._meta.many_to_many}
+
+    related_objects = []
+    for instance, related_objects_data in data:
+        for index, related_object_data in enumerate(related_objects_data or []):
+            if "id" in related_object_data or many_to_many_fields.intersection(related_object_data):
+                return False
+
+            related_object_data = dict(related_object_data)
+
+            if nested_relation["ordered"]:
+                related_object_data["order"] = index
+
+            related_object_data[nested_relation["model_name_in_related_object"]] = instance
+            related_object_data["deleted_at"] = None
+
+            related_objects.append(related_model(**related_object_data))
+
+    related_model._default_manager.bulk_create(related_objects, batch_size=batch_size)
+
+    return True
+
+
+def _get_loaded_instance(instances, model, primary_key, pk):
+    if not instances or primary_key != model._meta.pk.name:
+        return None
+
+    try:
+        return instances.get(model._meta.pk.to_python(pk))
+    except DjangoValidationError:
+        return None
+
+
+def _get_owned_instances(instances, related_manager, model, primary_key, ids):
+    """
+    The loaded instances of 'ids', by id, when they all belong to the related manager's instance, otherwise None.
+    """
+    field = getattr(related_manager, "field", None)
+    instance = getattr(related_manager, "instance", None)
+
+    if not instances or field is None or instance is None:
+        return None
+
+    owned = {}
+    for pk in ids:
+        related_object = _get_loaded_instance(instances, model, primary_key, pk)
+
+        if related_object is None or related_object.deleted_at is not None:
+            return None
+
+        if getattr(related_object, field.attname) != instance.pk:
+            return None
+
+        owned[pk] = related_object
+
+    return owned
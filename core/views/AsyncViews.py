@@ -0,0 +1,288 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from . import QueryParams, Conditional, Cache, Queries, QueryStats, Renderers, Timing
+from .Views import SmartAPIView, SmartDetailAPIView, SmartPaginationAPIView, PageBasedPagination, KeysetPagination
+
+__all__ = ["AsyncSmartAPIView", "AsyncSmartDetailAPIView", "AsyncSmartPaginationAPIView"]
+
+
+class AsyncSmartAPIView(SmartAPIView):
+    """
+    A SmartAPIView whose handlers are coroutines, for ASGI projects whose other views or middleware are async.
+
+    It isn't faster than SmartAPIView: django's async ORM runs every query in a thread (sync_to_async), and so do
+    authentication, permissions and throttling ('initial'), serialization and writes. Each of these hand-offs
+    costs more than the thread per request of a sync view, benchmarks/async_views.py measures the async list
+    view at about two thirds of the sync one's requests per second.
+
+    The query instrumentation, statistics and server timing are the same as SmartAPIView's, the queries are
+    recorded in the thread the request's ORM calls run in.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        instrumentation = self.query_instrumentation
+        if instrumentation is None:
+            instrumentation = Queries.is_enabled()
+
+        server_timing = self.server_timing
+        if server_timing is None:
+            server_timing = Timing.is_enabled()
+
+        statistics = QueryStats.is_enabled()
+
+        if server_timing:
+            self.timer = Timing.Timer()
+
+        if not instrumentation and not statistics and not server_timing:
+            return await self.adispatch(request, *args, **kwargs)
+
+        # the connections are per thread, the execute wrappers are installed in the one running the ORM calls
+        recording = Queries.record()
+        recorder = await sync_to_async(recording.__enter__)()
+
+        try:
+            response = await self.adispatch(request, *args, **kwargs)
+        finally:
+            await sync_to_async(recording.__exit__)(None, None, None)
+
+        if statistics:
+            await sync_to_async(QueryStats.collect)(self, request, recorder)
+
+        if instrumentation:
+            response = Queries.report(self, request, response, recorder, budget=self.query_budget,
+                                      action=self.query_budget_action, threshold=self.n_plus_one_threshold)
+
+        if server_timing:
+            self.timer.add("db", recorder.duration)
+            response = Timing.finish(self, request, response, self.timer)
+
+        return response
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        APIView.dispatch awaiting the handler.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+
+        return self.response
+
+    async def ais_allowed(self, request, method, model):
+        return await sync_to_async(self.is_allowed)(request, method, model)
+
+
+class AsyncSmartDetailAPIView(AsyncSmartAPIView, SmartDetailAPIView):
+    """
+    SmartDetailAPIView with the async ORM, the hooks ('add_filters', 'filter_queryset', 'override_response_data'
+    ...) are the same. Serialization runs in a thread as it may read relations, writes run in a thread as
+    'transaction.atomic' isn't supported by the async ORM.
+    """
+
+    async def get(self, request, id):
+
+        if not await self.ais_allowed(request, "GET", self.model):
+            return self.get_permission_denied_response(request, "GET")
+
+        with self.timer.phase("queryset"):
+            queryset = self.queryset(request, id)
+
+            # role permissions may be read from the database
+            queryset = await sync_to_async(self.filter_queryset)(queryset, "GET")
+
+            queryset = self.add_filters(queryset, request)
+
+            instance = await queryset.afirst()
+
+        if not instance:
+            return self.get_instance_not_found_response(request, "GET")
+
+        if not self.get_detail_serializer(request, instance):
+            return self.get_missing_serializer_response(request, "GET")
+
+        if not self.conditional_get:
+            return await sync_to_async(self.handle_get)(request, instance)
+
+        etag, last_modified = self.get_detail_validators(request, instance)
+
+        not_modified = Conditional.not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = await sync_to_async(self.handle_get)(request, instance)
+
+        return Conditional.set_validators(response, etag, last_modified)
+
+    async def patch(self, request, id):
+        return await sync_to_async(super().patch)(request, id)
+
+    async def delete(self, request, id):
+        return await sync_to_async(super().delete)(request, id)
+
+
+class AsyncSmartPaginationAPIView(AsyncSmartAPIView, SmartPaginationAPIView):
+    """
+    SmartPaginationAPIView with the async ORM: page based pagination counts with 'acount' and fetches the page
+    with async iteration, cursor and keyset pages are fetched in a thread. Exports, serialization and writes run
+    in a thread as well.
+    """
+
+    async def get(self, request):
+
+        if not await self.ais_allowed(request, "GET", self.model):
+            return self.get_permission_denied_response(request, "GET")
+
+        with self.timer.phase("queryset"):
+            queryset = self.queryset(request)
+
+            # role permissions may be read from the database
+            queryset = await sync_to_async(self.filter_queryset)(queryset, "GET")
+
+            queryset = self.add_filters(queryset, request)
+
+        serializer_class = self.get_list_serializer(request, queryset)
+
+        if not serializer_class:
+            return self.get_missing_serializer_response(request, "GET")
+
+        if QueryParams.get_str(request, 'export'):
+            return await sync_to_async(self.paginated_response)(queryset, serializer_class)
+
+        if not self.conditional_get:
+            return await self.acached_paginated_response(queryset, serializer_class)
+
+        etag, last_modified = await sync_to_async(self.get_list_validators)(request, queryset, serializer_class)
+
+        not_modified = Conditional.not_modified(request, etag, last_modified, Conditional.VARY)
+        if not_modified is not None:
+            return not_modified
+
+        response = await self.acached_paginated_response(queryset, serializer_class)
+
+        return Conditional.set_validators(response, etag, last_modified, Conditional.VARY)
+
+    async def acached_paginated_response(self, queryset, serializer_class):
+        if not self.cache_responses:
+            return await self.apaginated_response(queryset, serializer_class)
+
+        key = await sync_to_async(Cache.get_key)(self, self.request, [self.model, *self.get_cache_dependencies()],
+                                                 self.get_cache_scope(self.request))
+
+        cached = await sync_to_async(Cache.get)(self, key)
+        if cached is not None:
+            return Cache.to_response(cached)
+
+        response = await self.apaginated_response(queryset, serializer_class)
+
+        if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+            await sync_to_async(Cache.set)(key, response, self.cache_timeout)
+
+        return response
+
+    async def apaginated_response(self, queryset, serializer_class):
+
+        sparse_fields = self.get_sparse_fields(serializer_class)
+
+        queryset = self.optimise_queryset(queryset, serializer_class, sparse_fields)
+
+        order_by = self.get_order_by()
+
+        if order_by:
+            try:
+                queryset = queryset.order_by(*order_by)
+            except Exception as e:
+                return self.respond_with(f"This field: '{','.join(order_by)}' is not valid",
+                                         status_code=status.HTTP_400_BAD_REQUEST)
+
+        if self.allow_disable_pagination and QueryParams.get_bool(self.request, 'paginated') is False:
+            if not order_by:
+                if isinstance(self.paginator.ordering, list):
+                    queryset = queryset.order_by(*self.paginator.ordering)
+                else:
+                    queryset = queryset.order_by(self.paginator.ordering)
+
+            if self.stream_unpaginated:
+                return Renderers.astreamed_list_response(queryset, serializer_class, self.stream_chunk_size,
+                                                         **sparse_fields)
+
+            values_serializer = self.get_values_serializer(serializer_class, sparse_fields)
+
+            if values_serializer is not None:
+                rows = [row async for row in values_serializer.get_values_queryset(queryset)]
+
+                with self.timer.phase("serialize"):
+                    data = values_serializer.represent_values(rows)
+
+                return self.get_response(data)
+
+            instances = [instance async for instance in queryset]
+
+            with self.timer.phase("serialize"):
+                data = await sync_to_async(_serialize)(serializer_class, instances, sparse_fields)
+
+            return self.get_response(data)
+
+        values_serializer = None
+
+        # the cursors are read from the page's instances
+        if not isinstance(self.paginator, (CursorPagination, KeysetPagination)):
+            values_serializer = self.get_values_serializer(serializer_class, sparse_fields)
+
+        if values_serializer is not None:
+            queryset = values_serializer.get_values_queryset(queryset)
+
+        with self.timer.phase("pagination"):
+            page = await self.apaginate_queryset(queryset)
+
+        with self.timer.phase("serialize"):
+            if values_serializer is not None:
+                data = values_serializer.represent_values(page)
+            else:
+                data = await sync_to_async(_serialize)(serializer_class, page, sparse_fields)
+
+        return self.get_paginated_response(data)
+
+    async def apaginate_queryset(self, queryset):
+        if not isinstance(self.paginator, PageBasedPagination):
+            return await sync_to_async(self.paginate_queryset)(queryset)
+
+        self.set_page_size()
+
+        queryset = self.order_page_queryset(queryset)
+
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def post(self, request):
+        return await sync_to_async(super().post)(request)
+
+    async def put(self, request):
+        return await sync_to_async(super().put)(request)
+
+
+def _serialize(serializer_class, instances, sparse_fields):
+    return serializer_class(instances, many=True, **sparse_fields).data
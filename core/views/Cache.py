@@ -0,0 +1,85 @@
+import hashlib
+import threading
+
+from collections import defaultdict
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.response import Response
+
+from ..db import versions
+
+_stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+_stats_lock = threading.Lock()
+
+
+def get_key(view, request, models, scope):
+    """
+    The cache key of a response, it changes whenever one of the models is written to.
+
+    :param view: The view answering the request
+    :param models: The models the response is built from
+    :param scope: What the response is restricted to, e.g. the user
+    """
+    if not versions.is_enabled():
+        raise ImproperlyConfigured(f"{_get_view_name(view)}.cache_responses requires the API_CACHE_VERSIONS "
+                                   f"setting, the model versions aren't bumped without it")
+
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    model_versions = versions.get_versions(models)
+
+    value = repr((_get_view_name(view), str(scope), params, model_versions))
+    return f"api-utils:response:{hashlib.md5(value.encode('utf-8'), usedforsecurity=False).hexdigest()}"
+
+
+def get(view, key):
+    data = versions.get_cache().get(key)
+
+    with _stats_lock:
+        _stats[_get_view_name(view)]["hits" if data is not None else "misses"] += 1
+
+    return data
+
+
+def set(key, response, timeout):
+    """
+    Caches the data of the response with the headers set while building it, e.g. by a 'paginated_response'
+    override. The content type is picked when rendering and the per request headers (ETag, Vary, Server-Timing,
+    X-Query-Count...) are added after it, a cached response gets them again when it's served.
+    """
+    headers = {name: value for name, value in response.items() if name != "Content-Type"}
+
+    versions.get_cache().set(key, (response.data, headers), timeout)
+
+
+def to_response(cached):
+    data, headers = cached
+    return Response(data, headers=headers)
+
+
+def stats():
+    """
+    :return: The hits, misses and hit ratio of this process per view and in total
+    """
+    with _stats_lock:
+        views = {name: dict(counts) for name, counts in _stats.items()}
+
+    hits = sum(counts["hits"] for counts in views.values())
+    misses = sum(counts["misses"] for counts in views.values())
+
+    for counts in views.values():
+        counts["hit_ratio"] = _ratio(counts["hits"], counts["misses"])
+
+    return {"hits": hits, "misses": misses, "hit_ratio": _ratio(hits, misses), "views": views}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _ratio(hits, misses):
+    return hits / (hits + misses) if hits + misses else 0
+
+
+def _get_view_name(view):
+    return f"{type(view).__module__}.{type(view).__qualname__}"
@@ -0,0 +1,92 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from ..db import versions
+
+# the request headers identifying the user a list representation is scoped to
+VARY = ["Authorization", "Cookie"]
+
+
+def detail_validators(request, instance, *scope):
+    """
+    The ETag and Last-Modified of a single object, derived from its id and 'updated_at'.
+
+    :param scope: Anything else the representation depends on, e.g. the view and serializer classes
+    :return: (etag, last_modified) or (None, None) if the instance has no 'updated_at'
+    """
+    updated_at = getattr(instance, "updated_at", None)
+
+    if updated_at is None:
+        return None, None
+
+    return _etag(request, instance.pk, updated_at.isoformat(), *scope), updated_at
+
+
+def list_validators(request, queryset, *scope, models=None):
+    """
+    The ETag and Last-Modified of a filtered queryset, derived from its latest 'updated_at' and its count so
+    removed (or soft deleted) objects change the ETag as well.
+
+    With the 'API_CACHE_VERSIONS' setting the versions of 'models' are part of the ETag too, so writes that don't
+    touch 'updated_at' (update(), bulk_update()) and writes to the related models the representation reads
+    change it. Without it only the listed objects' own 'updated_at' is seen.
+
+    :param scope: Anything else the representation depends on, e.g. the view, serializer class and user
+    :param models: The models the representation is built from
+    :return: (etag, last_modified), last_modified is None for an empty queryset
+    """
+    aggregate = queryset.order_by().aggregate(last_updated_at=Max("updated_at"), count=Count("pk"))
+    last_updated_at = aggregate["last_updated_at"]
+
+    model_versions = versions.get_versions(models) if models and versions.is_enabled() else None
+
+    etag = _etag(request, aggregate["count"], last_updated_at.isoformat() if last_updated_at else "",
+                 model_versions, *scope)
+
+    return etag, last_updated_at
+
+
+def not_modified(request, etag, last_modified, vary=None):
+    """
+    :param vary: The request headers the representation varies by, see 'set_validators'
+    :return: A 304 (or 412) response if the client's copy is up to date, otherwise None
+    """
+    if etag is None and last_modified is None:
+        return None
+
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+
+    if response is not None:
+        set_validators(response, etag, last_modified, vary)
+
+    return response
+
+
+def set_validators(response, etag, last_modified, vary=None):
+    """
+    :param vary: The request headers the representation varies by e.g. 'VARY' when it's scoped to the user, so
+    shared caches don't answer one user's conditional request with another user's validators
+    """
+    if etag is not None and not response.has_header("ETag"):
+        response["ETag"] = etag
+
+    if last_modified is not None and not response.has_header("Last-Modified"):
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+
+    if vary:
+        patch_vary_headers(response, vary)
+
+    return response
+
+
+def _etag(request, *parts):
+    # the query string is part of the representation (pagination, filters, fields)
+    value = ":".join(str(part) for part in (request.get_full_path(), *parts))
+    return f'W/"{hashlib.md5(value.encode("utf-8"), usedforsecurity=False).hexdigest()}"'
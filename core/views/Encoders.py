@@ -0,0 +1,282 @@
+import csv
+import decimal
+import io
+import json
+import re
+import zipfile
+import zlib
+
+from xml.sax.saxutils import escape
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from . import QueryParams
+
+
+class Encoder:
+    """
+    Encodes the rows of an export. 'begin' receives the column names, rows are buffered with 'write' and the
+    encoded bytes (or text) are collected with 'flush' after each chunk and with 'end' once all rows are written.
+    """
+
+    content_type = None
+    extension = None
+
+    # rows can be encoded independently, so partitions encoded by separate workers can be concatenated
+    partitionable = False
+
+    def begin(self, keys):
+        raise NotImplementedError
+
+    def write(self, row):
+        raise NotImplementedError
+
+    def flush(self):
+        raise NotImplementedError
+
+    def end(self):
+        return self.flush()
+
+    def encoded(self, value):
+        """
+        Passes through the output of a row encoder of this class that ran elsewhere, e.g. in a pool worker.
+        """
+        return value
+
+    def get_row_encoder_class(self):
+        return type(self)
+
+
+class TextEncoder(Encoder):
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.keys = None
+
+    def flush(self):
+        value = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate(0)
+        return value
+
+
+class CsvEncoder(TextEncoder):
+    content_type = "text/csv"
+    extension = "csv"
+    partitionable = True
+
+    def __init__(self):
+        super().__init__()
+        self.writer = csv.writer(self.buffer)
+
+    def begin(self, keys):
+        self.keys = keys
+        self.writer.writerow(keys)
+        return self.flush()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+
+class NdjsonEncoder(TextEncoder):
+    """
+    One json object per line, keyed by the column names.
+    """
+    content_type = "application/x-ndjson"
+    extension = "ndjson"
+    partitionable = True
+
+    def begin(self, keys):
+        self.keys = keys
+        return ""
+
+    def write(self, row):
+        self.buffer.write(json.dumps(dict(zip(self.keys, row)), cls=DjangoJSONEncoder, ensure_ascii=False))
+        self.buffer.write("\n")
+
+
+class XlsxEncoder(Encoder):
+    """
+    Writes a single sheet workbook with inline strings, the zip archive is written to an unseekable sink so
+    only the current chunk is ever held in memory.
+    """
+    content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    extension = "xlsx"
+
+    CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    )
+
+    RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    )
+
+    WORKBOOK = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+    WORKBOOK_RELS = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    )
+
+    SHEET_START = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+    )
+
+    SHEET_END = '</sheetData></worksheet>'
+
+    ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+    def __init__(self):
+        self.sink = _Sink()
+        self.archive = zipfile.ZipFile(self.sink, "w", compression=zipfile.ZIP_DEFLATED)
+        self.sheet = None
+
+    def begin(self, keys):
+        self.archive.writestr("[Content_Types].xml", self.CONTENT_TYPES)
+        self.archive.writestr("_rels/.rels", self.RELS)
+        self.archive.writestr("xl/workbook.xml", self.WORKBOOK)
+        self.archive.writestr("xl/_rels/workbook.xml.rels", self.WORKBOOK_RELS)
+
+        self.sheet = self.archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self.sheet.write(self.SHEET_START.encode("utf-8"))
+        self.write(keys)
+
+        return self.flush()
+
+    def write(self, row):
+        self.sheet.write(f"<row>{''.join(self._cell(value) for value in row)}</row>".encode("utf-8"))
+
+    def flush(self):
+        return self.sink.pop()
+
+    def end(self):
+        self.sheet.write(self.SHEET_END.encode("utf-8"))
+        self.sheet.close()
+        self.archive.close()
+
+        return self.flush()
+
+    def _cell(self, value):
+        if value is None:
+            return "<c/>"
+
+        if isinstance(value, bool):
+            return f'<c t="b"><v>{int(value)}</v></c>'
+
+        if isinstance(value, (int, float, decimal.Decimal)):
+            return f'<c t="n"><v>{value}</v></c>'
+
+        text = self.ILLEGAL_CHARACTERS.sub("", str(value))
+        return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+class GzipEncoder(Encoder):
+    """
+    Compresses the output of another encoder on the fly.
+    """
+    content_type = "application/gzip"
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+
+        self.extension = f"{encoder.extension}.gz"
+        self.partitionable = encoder.partitionable
+
+    def begin(self, keys):
+        return self.encoded(self.encoder.begin(keys))
+
+    def write(self, row):
+        self.encoder.write(row)
+
+    def flush(self):
+        return self.encoded(self.encoder.flush())
+
+    def end(self):
+        return self.encoded(self.encoder.end()) + self.compressor.flush()
+
+    def encoded(self, value):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+
+        return self.compressor.compress(value)
+
+    def get_row_encoder_class(self):
+        return self.encoder.get_row_encoder_class()
+
+
+class _Sink:
+    """
+    A write-only file object, zipfile writes data descriptors instead of seeking back when it can't 'tell'.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        value = b"".join(self.chunks)
+        self.chunks = []
+        return value
+
+
+ENCODERS = {
+    "csv": CsvEncoder,
+    "ndjson": NdjsonEncoder,
+    "xlsx": XlsxEncoder,
+}
+
+COMPRESSIONS = ["gzip"]
+
+
+def from_request(request):
+    """
+    The encoder selected by '?export_format=' (csv by default) and '?compression='.
+    """
+    export_format = QueryParams.get_str(request, 'export_format', 'csv')
+    if export_format not in ENCODERS:
+        QueryParams.get_enum(request, 'export_format', list(ENCODERS), raise_exception=True)
+
+    encoder = ENCODERS[export_format]()
+
+    compression = QueryParams.get_str(request, 'compression')
+    if compression is not None:
+        QueryParams.get_enum(request, 'compression', COMPRESSIONS, raise_exception=True)
+        encoder = GzipEncoder(encoder)
+
+    return encoder
+
+
+def is_default(request):
+    return QueryParams.get_str(request, 'export_format', 'csv') == 'csv' and \
+        QueryParams.get_str(request, 'compression') is None
@@ -1,14 +1,27 @@
-from django.http import HttpResponse
-from datetime import timedelta, datetime
-from . import QueryParams
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count, DateField, DateTimeField, F
+from django.db.models.functions import Trunc
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from datetime import timedelta, datetime, time
+from dateutil.relativedelta import relativedelta
+from core import Exception as CustomException
+from . import QueryParams, Encoders
 import functools
+import operator
 
 import csv, json
 
+DEFAULT_CHUNK_SIZE = 2000
+
 
 def queryset(queryset, request):
 
-    file_name = QueryParams.get_str(request, 'filename') if QueryParams.get_str(request, 'filename') else 'export'
+    if QueryParams.get_bool(request, 'stream', False) or not Encoders.is_default(request):
+        return streamed_queryset(queryset, request)
+
+    file_name = get_file_name(request)
 
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename="{file_name}.csv"'
@@ -40,47 +53,249 @@ def queryset(queryset, request):
     return response
 
 
+def streamed_queryset(queryset, request, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams the export, reading the queryset 'chunk_size' rows at a time so memory stays flat regardless of the
+    table size. Each chunk is written to the client as soon as it has been formatted.
+
+    The output is encoded as selected by '?export_format=csv|ndjson|xlsx' and '?compression=gzip', see
+    'Encoders.from_request'. With '?parallel=true' the rows are formatted by a process pool, see
+    'ExportPartitions.stream'.
+    """
+
+    file_name = get_file_name(request)
+
+    options = json.loads(request.GET.get('options') or 'null')
+
+    order_by = QueryParams.get_str(request, 'order_by')
+
+    chunk_size = get_chunk_size(request, chunk_size)
+
+    encoder = Encoders.from_request(request)
+
+    if QueryParams.get_bool(request, 'parallel', False):
+        from . import ExportPartitions
+
+        partition_by = QueryParams.get_enum(request, 'partition_by', ["pk", "created_at"], default_value="pk")
+        content = ExportPartitions.stream(queryset, options, encoder=encoder, order_by=order_by,
+                                          chunk_size=chunk_size, partition_by=partition_by)
+    else:
+        content = stream(queryset, options, encoder=encoder, order_by=order_by, chunk_size=chunk_size)
+
+    response = StreamingHttpResponse(content, content_type=encoder.content_type)
+    response['Content-Disposition'] = f'attachment; filename="{file_name}.{encoder.extension}"'
+
+    return response
+
+
+def stream(queryset, options, encoder=None, order_by=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    The row pipeline shared by every export format, the rows are formatted by 'iter_custom_values' and
+    written by the encoder (csv by default).
+    """
+
+    encoder = encoder or Encoders.CsvEncoder()
+
+    if options:
+        keys = get_custom_headers(options)
+        rows = iter_custom_values(queryset, options, order_by=order_by, chunk_size=chunk_size)
+    else:
+        keys = [f.name for f in queryset.model._meta.fields]
+        rows = queryset.values_list().iterator(chunk_size=chunk_size)
+
+    yield encoder.begin(keys)
+
+    for index, row in enumerate(rows, start=1):
+        encoder.write(row)
+
+        if index % chunk_size == 0:
+            yield encoder.flush()
+
+    yield encoder.end()
+
+
+def get_chunk_size(request, default_value=DEFAULT_CHUNK_SIZE):
+    """
+    The '?chunk_size=' rows read and written at a time, a positive integer.
+    """
+    if QueryParams.get_str(request, 'chunk_size') is None:
+        return default_value
+
+    chunk_size = QueryParams.get_int(request, 'chunk_size', raise_exception=True)
+
+    if chunk_size < 1:
+        raise CustomException.raise_bad_request("chunk_size must be at least 1")
+
+    return chunk_size
+
+
+def get_file_name(request):
+    return QueryParams.get_str(request, 'filename') if QueryParams.get_str(request, 'filename') else 'export'
+
+
 def get_custom_headers_and_values(queryset, options, order_by=None):
 
-    keys = []
-    values = []
-    accessor_keys = {}
-    formats = {}
+    keys = get_custom_headers(options)
+    values = list(iter_custom_values(queryset, options, order_by=order_by))
+
+    return {"keys": keys, "values": values}
+
+
+def get_custom_headers(options):
+    return [column["name"] for column in options['columns']]
 
-    for column in options['columns']:
-        keys.append(column["name"])
-        accessor_keys[column["name"]] = column['accessor']
 
-        if "type" in column and "format" in column:
-            formats[column["name"]] = {"type": column['type'], "format": column["format"]}
+def iter_custom_values(queryset, options, order_by=None, chunk_size=None, keys=None):
+    """
+    Yields one formatted row per instance. When 'chunk_size' is given the queryset is read with
+    'iterator' so only one chunk (and its prefetched relations) is held in memory at a time. When 'keys'
+    (lookups) are given (values of the keys, row) tuples are yielded instead, e.g. to resume after a row.
 
-    if "select_related" in options and options["select_related"]:
-        queryset = queryset.select_related(*options['select_related'],)
+    The column accessors are compiled once into ORM lookups (see 'compile_columns'). If every column
+    can be resolved in sql the rows are read with 'values_list' and no model is instantiated, otherwise
+    only the accessors that need python (properties, methods, related objects) are read per instance.
+    """
 
-    if "prefetch_related" in options and options["prefetch_related"]:
-        queryset = queryset.prefetch_related(*options['prefetch_related'],)
+    plan = compile_columns(queryset.model, options['columns'])
 
     if order_by:
         queryset = queryset.order_by(order_by)
 
-    for instance in queryset:
+    size = len(plan["lookups"])
+
+    if all(lookup is not None for lookup in plan["lookups"]):
+        rows = queryset.values_list(*plan["lookups"], *(keys or []))
+        rows = rows.iterator(chunk_size=chunk_size) if chunk_size else rows
+
+        for row in rows:
+            values = [format_value(value, column_format) for value, column_format in zip(row, plan["formats"])]
+            yield (row[size:], values) if keys is not None else values
+
+        return
+
+    # the queryset's own select_related, prefetch_related (e.g. Prefetch(..., to_attr=...)) and deferred fields
+    # are kept, the plan's relations are added to them
+    select_related = plan["select_related"] + (options.get("select_related") or [])
+    if select_related and queryset.query.select_related is not True:
+        queryset = queryset.select_related(*select_related)
+
+    prefetch_related = plan["prefetch_related"] + (options.get("prefetch_related") or [])
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+
+    # sql columns that go through a relation are annotated, so they are read without walking related objects
+    getters = []
+    annotations = {}
+    for index, (lookup, accessor) in enumerate(zip(plan["lookups"], plan["accessors"])):
+        if lookup is None:
+            getters.append(functools.partial(rgetattr, attr=accessor))
+        elif "__" in lookup:
+            annotations[f"_export_{index}"] = F(lookup)
+            getters.append(operator.attrgetter(f"_export_{index}"))
+        else:
+            getters.append(operator.attrgetter(lookup))
 
-        temp = []
+    key_getters = []
+    for index, key in enumerate(keys or []):
+        annotations[f"_export_key_{index}"] = F(key)
+        key_getters.append(operator.attrgetter(f"_export_key_{index}"))
 
-        for key, accessor_value in accessor_keys.items():
-            value = rgetattr(instance, accessor_value)
+    if annotations:
+        queryset = queryset.annotate(**annotations)
 
-            if key in formats and value:
-                if formats[key]["type"] == "date":
-                    value = format_date(value, formats[key]["format"])
-                elif formats[key]["type"] == "number":
-                    value = format_number(value)
+    instances = queryset.iterator(chunk_size=chunk_size) if chunk_size else queryset
 
-            temp.append(value)
+    for instance in instances:
+        values = [format_value(getter(instance), column_format) for getter, column_format in zip(getters, plan["formats"])]
+        yield ([getter(instance) for getter in key_getters], values) if keys is not None else values
 
-        values.append(temp)
 
-    return {"keys": keys, "values": values}
+def compile_columns(model, columns):
+    """
+    Compiles the 'columns[].accessor' paths of the export options into ORM lookups ('a.b.c' -> 'a__b__c').
+
+    :param model: The model being exported
+    :param columns: The columns of the export options
+    :return: A dict with the 'lookups' of each column (None if the accessor needs python), the 'accessors',
+    the 'formats' and the 'select_related'/'prefetch_related' paths the python accessors walk through
+    """
+    lookups = []
+    accessors = []
+    formats = []
+    select_related = []
+    prefetch_related = []
+
+    for column in columns:
+        lookup, relations = _compile_accessor(model, column['accessor'])
+
+        lookups.append(lookup)
+        accessors.append(column['accessor'])
+        formats.append({"type": column['type'], "format": column["format"]}
+                       if "type" in column and "format" in column else None)
+
+        if lookup is not None:
+            continue
+
+        for path, many in relations:
+            related = prefetch_related if many or any(path.startswith(f"{p}__") for p in prefetch_related) \
+                else select_related
+
+            if path not in related:
+                related.append(path)
+
+    # a path that is extended by a longer one is already covered by it
+    select_related = [p for p in select_related if not any(o.startswith(f"{p}__") for o in select_related)]
+    prefetch_related = [p for p in prefetch_related if not any(o.startswith(f"{p}__") for o in prefetch_related)]
+
+    return {
+        "lookups": lookups,
+        "accessors": accessors,
+        "formats": formats,
+        "select_related": select_related,
+        "prefetch_related": prefetch_related,
+    }
+
+
+def _compile_accessor(model, accessor):
+    """
+    :return: The ORM lookup of the accessor, or None if it can't be read in sql, and the relations
+    (path, many) it walks through
+    """
+    parts = accessor.split('.')
+    relations = []
+
+    for index, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None, relations
+
+        is_last = index == len(parts) - 1
+        path = "__".join(parts[:index + 1])
+
+        # 'user_id' reads the column of the foreign key, not the related object
+        if field.is_relation and field.concrete and part == field.attname and part != field.name:
+            return (path, relations) if is_last else (None, relations)
+
+        if field.is_relation:
+            if field.related_model is None:
+                return None, relations
+
+            many = field.many_to_many or field.one_to_many
+            relations.append((path, many))
+
+            if is_last or many:
+                return None, relations
+
+            model = field.related_model
+            continue
+
+        if not is_last or not field.concrete:
+            return None, relations
+
+        return path, relations
+
+    return None, relations
 
 
 def rsetattr(obj, attr, val):
@@ -94,6 +309,16 @@ def rgetattr(obj, attr, *args):
     return functools.reduce(_getattr, [obj] + attr.split('.'))
 
 
+def format_value(value, column_format):
+    if column_format and value:
+        if column_format["type"] == "date":
+            value = format_date(value, column_format["format"])
+        elif column_format["type"] == "number":
+            value = format_number(value)
+
+    return value
+
+
 def format_date(date, format):
     return date.strftime(format)
 
@@ -151,17 +376,117 @@ def _fill(array):
 
     days_no = (end_date - start_date).days  # how many days between?
 
+    counts = {entry["date"]: entry["count"] for entry in array}
+
     filled_array = []
     for i in range(days_no + 1):
         date = start_date + timedelta(days=i)
         filled_array.append({
             "date": date,
-            "count": 0,
+            "count": counts.get(date, 0),
         })
 
-    for i, entry in enumerate(array, start=0):
-        for j, data in enumerate(filled_array, start=0):
-            if entry["date"] == data["date"]:
-                data["count"] = entry["count"]
-
     return filled_array
+
+
+BUCKETS = ["day", "week", "month"]
+
+
+def time_series(queryset, date_field, bucket="day", series=None, start=None, end=None):
+    """
+    Aggregates the queryset per 'bucket' in sql and fills the buckets without any entries with 0.
+
+    :param queryset: The queryset to aggregate
+    :param date_field: The date or datetime field the entries are bucketed by
+    :param bucket: One of 'day', 'week' (starting on monday) or 'month'
+    :param series: The aggregates to compute per bucket e.g. {"count": Count("id"), "total": Sum("total")},
+    defaults to {"count": Count("pk")}
+    :param start: The first date of the series, defaults to the first entry
+    :param end: The last date of the series, defaults to the last entry
+    :return: A list of {"date": date, <series>: value} in ascending order of date
+    """
+
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {BUCKETS}")
+
+    series = series or {"count": Count("pk")}
+
+    is_datetime_field = isinstance(_get_field(queryset.model, date_field), DateTimeField)
+
+    if start is not None:
+        start = _to_date(start)
+        queryset = queryset.filter(**{f"{date_field}__gte": _to_lookup_value(start, is_datetime_field)})
+
+    if end is not None:
+        end = _to_date(end)
+        upper = _to_lookup_value(end + timedelta(days=1), is_datetime_field)
+        queryset = queryset.filter(**{f"{date_field}__lt": upper})
+
+    # entries without a date don't fall in any bucket
+    rows = queryset.order_by() \
+        .filter(**{f"{date_field}__isnull": False}) \
+        .annotate(_bucket=Trunc(date_field, bucket, output_field=DateField())) \
+        .values("_bucket") \
+        .annotate(**series)
+
+    entries = {row.pop("_bucket"): row for row in rows}
+
+    start = _to_bucket(start, bucket) if start is not None else min(entries, default=None)
+    end = _to_bucket(end, bucket) if end is not None else max(entries, default=None)
+
+    if start is None or end is None:
+        return []
+
+    empty = {name: 0 for name in series}
+
+    filled = []
+    date = start
+    while date <= end:
+        filled.append({"date": date, **entries.get(date, empty)})
+        date = _next_bucket(date, bucket)
+
+    return filled
+
+
+def _get_field(model, path):
+    field = None
+    for part in path.split("__"):
+        field = model._meta.get_field(part)
+        model = field.related_model
+
+    return field
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+    return value
+
+
+def _to_lookup_value(date, is_datetime_field):
+    if not is_datetime_field:
+        return date
+
+    value = datetime.combine(date, time.min)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+
+def _to_bucket(date, bucket):
+    if bucket == "week":
+        return date - timedelta(days=date.weekday())
+
+    if bucket == "month":
+        return date.replace(day=1)
+
+    return date
+
+
+def _next_bucket(date, bucket):
+    if bucket == "week":
+        return date + timedelta(days=7)
+
+    if bucket == "month":
+        return date + relativedelta(months=1)
+
+    return date + timedelta(days=1)
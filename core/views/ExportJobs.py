@@ -0,0 +1,452 @@
+import contextlib
+import gzip
+import json
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import FileResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import Exception as CustomException
+from . import Encoders, Export, QueryParams
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PENDING = "pending"
+RUNNING = "running"
+FINISHED = "finished"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_executor = None
+_executor_lock = threading.Lock()
+_job_lock = threading.RLock()
+_checked_directories = set()
+
+
+def get_directory():
+    """
+    The spool directory, 'EXPORT_JOBS_DIR' or a directory of the current user in the temporary directory.
+    The queries are unpickled from there, so it must be private: it's created with mode 0700 and refused if
+    it's a link, belongs to another user or is accessible by others.
+    """
+    directory = getattr(settings, "EXPORT_JOBS_DIR", None) or \
+        os.path.join(tempfile.gettempdir(), f"django-api-utils-exports-{_get_uid()}")
+
+    if directory in _checked_directories:
+        return directory
+
+    try:
+        os.makedirs(directory, mode=0o700)
+    except FileExistsError:
+        pass
+
+    info = os.lstat(directory)
+    uid = _get_uid()
+
+    if not stat.S_ISDIR(info.st_mode) or (uid is not None and info.st_uid != uid) or info.st_mode & 0o077:
+        raise ImproperlyConfigured(f"The export jobs directory '{directory}' must be a directory owned by the "
+                                   f"current user and not accessible by others (mode 0700)")
+
+    _checked_directories.add(directory)
+    return directory
+
+
+def get_executor():
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "EXPORT_JOBS_WORKERS", 2),
+                thread_name_prefix="export-job"
+            )
+
+    return _executor
+
+
+def create(queryset, request, chunk_size=Export.DEFAULT_CHUNK_SIZE):
+    """
+    Spools the export of the queryset to local storage in a background worker.
+
+    The queryset is ordered with a 'pk' tiebreaker so an interrupted or cancelled job can be resumed after
+    the last row written to disk (see 'get_ordering'). The output is encoded as selected by
+    '?export_format=csv|ndjson' and '?compression=gzip', xlsx can't be appended to so it's rejected.
+
+    :return: The job
+    """
+
+    options = json.loads(request.GET.get('options') or 'null')
+
+    encoder = Encoders.from_request(request)
+    if not encoder.partitionable:
+        raise CustomException.raise_bad_request("Background exports can't be written as "
+                                                f"'{QueryParams.get_str(request, 'export_format')}'")
+
+    order_by = QueryParams.get_str(request, 'order_by')
+    if order_by:
+        queryset = queryset.order_by(order_by)
+
+    ordering = get_ordering(queryset)
+    queryset = queryset.order_by(*ordering)
+
+    user = getattr(request, "user", None)
+    now = timezone.now().isoformat()
+
+    job = {
+        "id": uuid.uuid4().hex,
+        "status": PENDING,
+        "model": queryset.model._meta.label,
+        "owner": str(user.pk) if user is not None and user.is_authenticated else None,
+        "file_name": Export.get_file_name(request),
+        "options": options,
+        "export_format": QueryParams.get_str(request, 'export_format', 'csv'),
+        "compression": QueryParams.get_str(request, 'compression'),
+        "extension": encoder.extension,
+        "content_type": encoder.content_type,
+        "ordering": ordering,
+        "chunk_size": Export.get_chunk_size(request, chunk_size),
+        "attempt": 1,
+        "total": None,
+        "rows": 0,
+        "bytes": 0,
+        "last": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+    with open(_path(job["id"], "query"), "wb") as file:
+        pickle.dump(queryset.query, file)
+
+    save(job)
+
+    get_executor().submit(run, job["id"], job["attempt"])
+
+    return job
+
+
+def get_ordering(queryset):
+    """
+    The ordering of the queryset (or of its model) ending with the primary key, so each row has a unique
+    position the export can be resumed after. Orderings by expressions can't be compared with the values of
+    the last row, these querysets are ordered by the primary key, as are models ordered by nullable fields.
+    A queryset ordered by a nullable field is rejected.
+
+    :return: The names of the ordering fields, '-' prefixed if descending
+    """
+    from .Views import KeysetPagination
+
+    ordering = list(queryset.query.order_by)
+
+    if ordering and all(isinstance(field, str) for field in ordering) and \
+            not KeysetPagination().is_orderable(queryset.model, ordering):
+        raise CustomException.raise_bad_request("Background exports can't be ordered by a nullable field")
+
+    ordering = ordering or list(queryset.model._meta.ordering)
+
+    if not all(isinstance(field, str) and field != "?" for field in ordering) or \
+            not KeysetPagination().is_orderable(queryset.model, ordering):
+        ordering = []
+
+    pk_names = ["pk", queryset.model._meta.pk.name, queryset.model._meta.pk.attname]
+    if not ordering or ordering[-1].lstrip("-") not in pk_names:
+        ordering.append("pk")
+
+    return ordering
+
+
+def get(job_id):
+    try:
+        with open(_path(job_id, "json")) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def save(job):
+    job["updated_at"] = timezone.now().isoformat()
+
+    path = _path(job["id"], "json")
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(job, file)
+
+    os.replace(f"{path}.tmp", path)
+
+
+@contextlib.contextmanager
+def _locked(job_id):
+    """
+    Holds the lock of the job around reading, checking and saving it, across the threads of this process and,
+    with a lock file, across the processes sharing the spool directory.
+    """
+    with _job_lock, open(_path(job_id, "lock"), "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def cancel(job_id):
+    if get(job_id) is None:
+        return None
+
+    with _locked(job_id):
+        job = get(job_id)
+
+        if job is None or job["status"] in [FINISHED, FAILED, CANCELLED]:
+            return job
+
+        job["status"] = CANCELLED
+        save(job)
+
+    return job
+
+
+def resume(job_id):
+    """
+    Re-enqueues a cancelled or failed job, or a running job whose worker stopped reporting progress (see
+    'is_stale'), it continues after the last row written to disk. The job gets a new attempt number so a
+    worker still running a previous attempt stops at its next chunk instead of writing to the file.
+    """
+    if get(job_id) is None:
+        return None
+
+    with _locked(job_id):
+        job = get(job_id)
+
+        if job is None or not (job["status"] in [FAILED, CANCELLED] or is_stale(job)):
+            return job
+
+        job["status"] = PENDING
+        job["error"] = None
+        job["attempt"] += 1
+        save(job)
+
+    get_executor().submit(run, job_id, job["attempt"])
+
+    return job
+
+
+def is_stale(job):
+    """
+    :return: True if the job is running but wasn't updated for 'EXPORT_JOBS_STALE_AFTER' seconds (600 by
+    default), e.g. because its worker was restarted
+    """
+    if job["status"] != RUNNING:
+        return False
+
+    stale_after = timedelta(seconds=getattr(settings, "EXPORT_JOBS_STALE_AFTER", 600))
+
+    return parse_datetime(job["updated_at"]) + stale_after < timezone.now()
+
+
+def delete(job_id):
+    cancel(job_id)
+
+    for extension in ["part", "query", "json", "lock", _get_extension(get(job_id) or {})]:
+        try:
+            os.remove(_path(job_id, extension))
+        except FileNotFoundError:
+            pass
+
+
+def run(job_id, attempt):
+    try:
+        with _locked(job_id):
+            job = get(job_id)
+
+            if job is None or job["status"] != PENDING or job["attempt"] != attempt:
+                return
+
+            job["status"] = RUNNING
+            save(job)
+
+        _export(job)
+
+    except Exception as e:
+        with _locked(job_id):
+            job = get(job_id)
+            if job is not None and job["attempt"] == attempt and job["status"] == RUNNING:
+                job["status"] = FAILED
+                job["error"] = str(e)
+                save(job)
+
+    finally:
+        connection.close()
+
+
+def _export(job):
+    queryset = _load_queryset(job)
+
+    if job["total"] is None:
+        job["total"] = queryset.count()
+
+    options = job["options"]
+    chunk_size = job["chunk_size"]
+    ordering = job["ordering"]
+    keys = [field.lstrip("-") for field in ordering]
+    encoder = Encoders.ENCODERS[job["export_format"]]()
+    path = _path(job["id"], "part")
+
+    # resume after the last row that made it to disk, compared by its ordering values instead of skipping
+    # the rows already written with an offset
+    if job["last"] is not None:
+        from .Views import KeysetPagination
+        queryset = queryset.filter(KeysetPagination().get_predicate(queryset, ordering, job["last"], False))
+
+    with open(path, "r+b" if os.path.exists(path) else "wb") as file:
+        file.truncate(job["bytes"])
+        file.seek(job["bytes"])
+
+        header = encoder.begin(Export.get_custom_headers(options) if options else
+                               [f.name for f in queryset.model._meta.fields])
+
+        if job["bytes"] == 0 and header and not _write_chunk(file, _encode(job, header), job, 0, None):
+            return
+
+        if options:
+            rows = Export.iter_custom_values(queryset, options, chunk_size=chunk_size, keys=keys)
+        else:
+            columns = [f.attname for f in queryset.model._meta.fields]
+            rows = ((row[len(columns):], row[:len(columns)])
+                    for row in queryset.values_list(*columns, *keys).iterator(chunk_size=chunk_size))
+
+        written = 0
+        last = None
+        for last, row in rows:
+            encoder.write(row)
+            written += 1
+
+            if written == chunk_size:
+                if not _write_chunk(file, _encode(job, encoder.flush()), job, written, last):
+                    return
+
+                written = 0
+
+        if not _write_chunk(file, _encode(job, encoder.end()), job, written, last):
+            return
+
+        with _locked(job["id"]):
+            if not _is_current(job):
+                return
+
+            os.replace(path, _path(job["id"], _get_extension(job)))
+
+            job["status"] = FINISHED
+            save(job)
+
+
+def _encode(job, value):
+    """
+    Compressed chunks are written as separate gzip members, a resumed job appends its members after the
+    last complete one.
+    """
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+
+    return gzip.compress(value) if job["compression"] and value else value
+
+
+def _write_chunk(file, data, job, rows, last):
+    """
+    Writes the chunk and records its progress, 'last' being the ordering values of its last row.
+
+    :return: False if the job was cancelled or resumed by another worker in the meantime
+    """
+    with _locked(job["id"]):
+        if not _is_current(job):
+            return False
+
+        file.write(data)
+        file.flush()
+
+        job["rows"] += rows
+        job["bytes"] = file.tell()
+        if last is not None:
+            job["last"] = json.loads(json.dumps(list(last), cls=DjangoJSONEncoder))
+        save(job)
+
+    return True
+
+
+def _is_current(job):
+    """
+    :return: True if the job is still running the attempt of this worker
+    """
+    current = get(job["id"])
+
+    return current is not None and current["status"] == RUNNING and current["attempt"] == job["attempt"]
+
+
+def _load_queryset(job):
+    model = apps.get_model(job["model"])
+
+    with open(_path(job["id"], "query"), "rb") as file:
+        query = pickle.load(file)
+
+    queryset = model._default_manager.all()
+    queryset.query = query
+    return queryset
+
+
+def _get_extension(job):
+    return job.get("extension", "csv")
+
+
+def _get_uid():
+    return os.getuid() if hasattr(os, "getuid") else None
+
+
+def _path(job_id, extension):
+    if not job_id.isalnum():
+        raise ValueError(f"Invalid export job id '{job_id}'")
+
+    return os.path.join(get_directory(), f"{job_id}.{extension}")
+
+
+def file_response(job):
+    extension = _get_extension(job)
+
+    return FileResponse(
+        open(_path(job["id"], extension), "rb"),
+        as_attachment=True,
+        filename=f"{job['file_name']}.{extension}",
+        content_type=job.get("content_type", "text/csv")
+    )
+
+
+def representation(job):
+    total = job["total"]
+
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "file_name": job["file_name"],
+        "rows": job["rows"],
+        "total": total,
+        "progress": min(job["rows"] / total, 1) if total else (1 if job["status"] == FINISHED else 0),
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
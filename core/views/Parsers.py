@@ -0,0 +1,194 @@
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from django.http import QueryDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.settings import api_settings
+from rest_framework.utils.json import strict_constant
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+class StreamingJSONParser(BaseParser):
+    """
+    Parses a JSON array lazily: the data is an iterator reading the elements from the request stream one at a
+    time, for SmartPaginationAPIView's 'stream_bulk_insert'. Any other JSON body is parsed as usual.
+    """
+    media_type = "application/json"
+    strict = api_settings.STRICT_JSON
+    chunk_size = DEFAULT_CHUNK_SIZE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        decoder = json.JSONDecoder(parse_constant=strict_constant if self.strict else None)
+        reader = _Reader(stream, codecs.getincrementaldecoder(encoding)(), self.chunk_size)
+
+        position = reader.skip_whitespace(0)
+
+        if reader.buffer[position:position + 1] != "[":
+            try:
+                return decoder.decode(reader.read_all())
+            except ValueError as exc:
+                raise ParseError("JSON parse error - %s" % str(exc))
+
+        return iter_json_array(reader, decoder, position + 1)
+
+
+class StreamingCSVParser(BaseParser):
+    """
+    Parses CSV lazily: the data is an iterator of the rows, by the names of the header row, read from the request
+    stream one line at a time. The rows are QueryDicts so empty cells are handled like empty form fields.
+    """
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        return iter_csv_rows(stream, encoding)
+
+
+def iter_json_array(reader, decoder, position):
+    """
+    Yields the elements of the array read by 'reader', from after its '[' at 'position'.
+    """
+    expect_value = False
+    first = True
+
+    while True:
+        position = reader.skip_whitespace(position)
+
+        if position == len(reader.buffer):
+            raise ParseError("JSON parse error - Unterminated array")
+
+        char = reader.buffer[position]
+
+        if char == "]" and not expect_value:
+            position = reader.skip_whitespace(position + 1)
+
+            if position != len(reader.buffer):
+                raise ParseError("JSON parse error - Extra data after the array")
+
+            return
+
+        if not first and not expect_value:
+            if char != ",":
+                raise ParseError("JSON parse error - Expecting ',' delimiter")
+
+            position += 1
+            expect_value = True
+            continue
+
+        value, position = reader.decode(decoder, position)
+
+        yield value
+
+        expect_value = False
+        first = False
+
+
+def iter_csv_rows(stream, encoding):
+    lines = (line.decode(encoding) for line in stream)
+
+    try:
+        for row in csv.DictReader(lines):
+            data = QueryDict(mutable=True)
+
+            for key, value in row.items():
+                if key is not None:
+                    data[key] = value
+
+            yield data
+    except (csv.Error, UnicodeDecodeError) as exc:
+        raise ParseError("CSV parse error - %s" % str(exc))
+
+
+def batches(rows, size):
+    """
+    Yields (index of the first row, rows) 'size' rows at a time.
+    """
+    start = 0
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) >= size:
+            yield start, batch
+            start += len(batch)
+            batch = []
+
+    if batch:
+        yield start, batch
+
+
+class _Reader:
+    """
+    The decoded text read so far from a stream, the consumed text is dropped each time more is read so only the
+    current element is held in memory.
+    """
+
+    def __init__(self, stream, decoder, chunk_size):
+        self.stream = stream
+        self.decoder = decoder
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.eof = stream is None
+
+    def read(self, position) -> int:
+        """
+        Reads the next chunk, dropping the text before 'position'.
+
+        :return: The position in the new buffer
+        """
+        chunk = self.stream.read(self.chunk_size)
+
+        try:
+            text = self.decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
+
+        self.eof = not chunk
+        self.buffer = self.buffer[position:] + text
+
+        return 0
+
+    def read_all(self) -> str:
+        while not self.eof:
+            self.read(0)
+
+        return self.buffer
+
+    def skip_whitespace(self, position) -> int:
+        while True:
+            while position < len(self.buffer) and self.buffer[position] in _WHITESPACE:
+                position += 1
+
+            if position < len(self.buffer) or self.eof:
+                return position
+
+            position = self.read(position)
+
+    def decode(self, decoder, position):
+        """
+        :return: The value at 'position' and the position after it, reading until the value is complete
+        """
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, position)
+            except ValueError as exc:
+                if self.eof:
+                    raise ParseError("JSON parse error - %s" % str(exc))
+            else:
+                # a number at the end of the buffer may go on in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    return value, end
+
+            position = self.read(position)
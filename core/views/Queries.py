@@ -0,0 +1,147 @@
+import logging
+import re
+import time
+
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+import sqlparse
+from sqlparse import tokens
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("core.queries")
+
+_PLACEHOLDERS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """
+    A 'connection.execute_wrapper' that counts the statements run during a request by fingerprint.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+        # (fingerprint, duration, rows) of each statement, rows is None when the backend doesn't report it
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            statement = fingerprint(sql)
+
+            rowcount = getattr(context.get("cursor"), "rowcount", -1)
+
+            self.duration += duration
+            self.count += 1
+            self.fingerprints[statement] += 1
+            self.statements.append((statement, duration, rowcount if rowcount >= 0 else None))
+
+    def get_repeated(self, threshold):
+        """
+        :return: [(fingerprint, count)] of the SELECTs run at least 'threshold' times, the usual sign of an N+1
+        """
+        return [
+            (statement, count) for statement, count in self.fingerprints.most_common()
+            if count >= threshold and statement.startswith("SELECT")
+        ]
+
+
+def is_enabled():
+    return getattr(settings, "API_QUERY_INSTRUMENTATION", settings.DEBUG)
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """
+    The statement with its literals and placeholders replaced by '?', its comments removed and its IN lists
+    collapsed, so the same query with other values has the same fingerprint. Cached as the ORM generates the
+    same SQL (with placeholders) over and over.
+    """
+    parts = []
+
+    for token in sqlparse.parse(sql)[0].flatten() if sql.strip() else []:
+        if token.ttype in tokens.Comment:
+            continue
+
+        if token.ttype in tokens.Literal.String.Single or token.ttype in tokens.Literal.Number or \
+                token.ttype in tokens.Name.Placeholder:
+            parts.append("?")
+        else:
+            parts.append(token.value)
+
+    sql = _WHITESPACE.sub(" ", "".join(parts)).strip()
+
+    return _PLACEHOLDERS.sub("(...)", sql)
+
+
+@contextmanager
+def record(using=None):
+    """
+    Records the statements run on the given database aliases (all of them by default) in this thread.
+    """
+    recorder = QueryRecorder()
+
+    with ExitStack() as stack:
+        for alias in using or connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+
+        yield recorder
+
+
+def report(view, request, response, recorder, budget=None, action="log", threshold=5):
+    """
+    Logs the queries of the request, flags likely N+1 access and enforces the query budget.
+
+    :param budget: The maximum number of queries, None for no budget
+    :param action: What to do when the budget is exceeded, 'log', 'header' or 'raise' (e.g. in tests)
+    :param threshold: How often the same SELECT has to run to be reported as an N+1
+    """
+    name = f"{type(view).__module__}.{type(view).__qualname__}"
+    repeated = recorder.get_repeated(threshold)
+    exceeded = budget is not None and recorder.count > budget
+
+    extra = {
+        "view": name,
+        "method": request.method,
+        "path": request.path,
+        "query_count": recorder.count,
+        "query_duration": round(recorder.duration, 6),
+        "query_budget": budget,
+        "repeated_queries": [{"sql": statement, "count": count} for statement, count in repeated],
+    }
+
+    if repeated:
+        logger.warning("%s %s ran %s similar queries, likely an N+1", request.method, name, repeated[0][1],
+                       extra=extra)
+
+    if exceeded:
+        logger.warning("%s %s ran %s queries, over its budget of %s", request.method, name, recorder.count,
+                       budget, extra=extra)
+    else:
+        logger.debug("%s %s ran %s queries", request.method, name, recorder.count, extra=extra)
+
+    if action in ["header", "raise"]:
+        response["X-Query-Count"] = str(recorder.count)
+        if budget is not None:
+            response["X-Query-Budget"] = str(budget)
+
+    if exceeded and action == "raise":
+        statements = "\n".join(f"{count}x {statement}" for statement, count in recorder.fingerprints.most_common())
+        raise QueryBudgetExceeded(f"{name} ran {recorder.count} queries, over its budget of {budget}:\n{statements}")
+
+    return response
@@ -0,0 +1,154 @@
+import os
+import socket
+import threading
+import time
+
+from collections import deque
+
+from django.conf import settings
+
+from ..db import versions
+
+ORDERINGS = ["total", "count", "mean", "p50", "p95", "p99", "rows"]
+
+_REGISTRY_KEY = "api-utils:query-stats:processes"
+
+_stats = {}
+_stats_lock = threading.Lock()
+_published_at = 0.0
+
+
+def is_enabled():
+    return getattr(settings, "API_QUERY_STATS", False)
+
+
+def get_sample_size():
+    return getattr(settings, "API_QUERY_STATS_SAMPLES", 1000)
+
+
+def get_publish_interval():
+    return getattr(settings, "API_QUERY_STATS_PUBLISH_INTERVAL", 10)
+
+
+def collect(view, request, recorder):
+    """
+    Adds the statements recorded during a request to the statistics of this process, per view, HTTP method
+    and fingerprint. The percentiles are computed from the latest 'API_QUERY_STATS_SAMPLES' durations.
+    """
+    name = f"{type(view).__module__}.{type(view).__qualname__}"
+
+    with _stats_lock:
+        for statement, duration, rows in recorder.statements:
+            key = (name, request.method, statement)
+
+            entry = _stats.get(key)
+            if entry is None:
+                entry = _stats[key] = {
+                    "count": 0, "total": 0.0, "rows": 0, "samples": deque(maxlen=get_sample_size())
+                }
+
+            entry["count"] += 1
+            entry["total"] += duration
+            entry["rows"] += rows or 0
+            entry["samples"].append(duration)
+
+    if time.monotonic() - _published_at >= get_publish_interval():
+        publish()
+
+
+def publish():
+    """
+    Shares the statistics of this process through the 'API_CACHE_ALIAS' cache so 'stats' can merge the
+    statistics of every worker, the snapshot expires when the process stops publishing.
+    """
+    global _published_at
+
+    with _stats_lock:
+        snapshot = [
+            (*key, entry["count"], entry["total"], entry["rows"], list(entry["samples"]))
+            for key, entry in _stats.items()
+        ]
+        _published_at = time.monotonic()
+
+    cache = versions.get_cache()
+    timeout = get_publish_interval() * 30
+
+    key = _get_process_key()
+    cache.set(key, snapshot, timeout)
+
+    processes = cache.get(_REGISTRY_KEY) or []
+    if key not in processes:
+        cache.set(_REGISTRY_KEY, [*processes, key], None)
+
+
+def stats(order_by="total", limit=None, view=None):
+    """
+    :param order_by: One of ORDERINGS, descending
+    :param view: Only the queries of views whose name contains it
+    :return: The merged statistics of all processes, one row per view, method and fingerprint
+    """
+    if _stats:
+        publish()
+
+    cache = versions.get_cache()
+    processes = cache.get(_REGISTRY_KEY) or []
+    snapshots = cache.get_many(processes)
+
+    merged = {}
+    for snapshot in snapshots.values():
+        for name, method, statement, count, total, rows, samples in snapshot:
+            entry = merged.setdefault((name, method, statement), {"count": 0, "total": 0.0, "rows": 0, "samples": []})
+            entry["count"] += count
+            entry["total"] += total
+            entry["rows"] += rows
+            entry["samples"].extend(samples)
+
+    results = []
+    for (name, method, statement), entry in merged.items():
+        if view and view not in name:
+            continue
+
+        samples = sorted(entry["samples"])
+
+        results.append({
+            "view": name,
+            "method": method,
+            "sql": statement,
+            "count": entry["count"],
+            "total": entry["total"],
+            "mean": entry["total"] / entry["count"],
+            "p50": _percentile(samples, 50),
+            "p95": _percentile(samples, 95),
+            "p99": _percentile(samples, 99),
+            "rows": entry["rows"],
+        })
+
+    results.sort(key=lambda result: result[order_by], reverse=True)
+
+    return results[:limit] if limit else results
+
+
+def reset():
+    global _published_at
+
+    with _stats_lock:
+        _stats.clear()
+        _published_at = 0.0
+
+    cache = versions.get_cache()
+    processes = cache.get(_REGISTRY_KEY) or []
+
+    cache.delete_many([*processes, _REGISTRY_KEY])
+
+
+def _percentile(samples, percentile):
+    if not samples:
+        return None
+
+    # nearest rank
+    index = max(0, -(-len(samples) * percentile // 100) - 1)
+    return samples[index]
+
+
+def _get_process_key():
+    return f"api-utils:query-stats:{socket.gethostname()}:{os.getpid()}"
@@ -0,0 +1,134 @@
+import json
+import math
+
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_CHUNK_SIZE = 500
+
+_encoder = encoders.JSONEncoder()
+
+
+def dumps(data, strict=False) -> bytes:
+    """
+    Encodes like DRF's compact JSONRenderer, with orjson when it's installed. Datetimes, dates, times, Decimals,
+    UUIDs and anything else orjson can't encode go through DRF's JSONEncoder so they are encoded the same.
+
+    :param strict: Raise a ValueError for NaN and Infinity like the STRICT_JSON renderer, orjson writes them as null
+    """
+    if orjson is not None:
+        try:
+            content = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME |
+                                   orjson.OPT_NON_STR_KEYS)
+        except (TypeError, orjson.JSONEncodeError):
+            # e.g. integers over 64 bit
+            pass
+        else:
+            if strict and b"null" in content and _has_non_finite_float(data):
+                raise ValueError("Out of range float values are not JSON compliant")
+
+            return content.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+
+    content = json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, allow_nan=not strict,
+                         separators=(",", ":"))
+    return content.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029").encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    A JSONRenderer encoding compact responses with orjson when it's installed (see 'dumps'), e.g. in
+    REST_FRAMEWORK's DEFAULT_RENDERER_CLASSES. Indented responses and the ASCII or strict JSON settings are left
+    to the standard renderer. The output is the same bytes, except for floats in exponent notation which orjson
+    writes without the '+' and leading zeros (1e16 instead of 1e+16) and, without STRICT_JSON, NaN/Infinity which
+    it writes as null.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return dumps(data, strict=self.strict)
+
+
+def stream_list(queryset, serializer_class, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Yields the JSON array of the serialized queryset, the instances are fetched and serialized 'chunk_size'
+    at a time (prefetches included) so only one chunk is held in memory.
+
+    :param kwargs: Passed to the serializer e.g. the sparse fieldsets
+    """
+    yield b"["
+
+    separator = b""
+    chunk = []
+
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+
+        if len(chunk) >= chunk_size:
+            yield separator + _encode_chunk(serializer_class, chunk, kwargs)
+            separator = b","
+            chunk = []
+
+    if chunk:
+        yield separator + _encode_chunk(serializer_class, chunk, kwargs)
+
+    yield b"]"
+
+
+def streamed_list_response(queryset, serializer_class, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    return StreamingHttpResponse(stream_list(queryset, serializer_class, chunk_size, **kwargs),
+                                 content_type="application/json")
+
+
+async def astream_list(queryset, serializer_class, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    'stream_list' for async views, each chunk is fetched and serialized in a thread when the client reads it.
+    """
+    chunks = stream_list(queryset, serializer_class, chunk_size, **kwargs)
+    next_chunk = sync_to_async(next)
+
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def astreamed_list_response(queryset, serializer_class, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    return StreamingHttpResponse(astream_list(queryset, serializer_class, chunk_size, **kwargs),
+                                 content_type="application/json")
+
+
+def _encode_chunk(serializer_class, instances, kwargs):
+    data = serializer_class(instances, many=True, **kwargs).data
+    return b",".join(dumps(item, strict=api_settings.STRICT_JSON) for item in data)
+
+
+def _has_non_finite_float(data) -> bool:
+    if isinstance(data, float):
+        return not math.isfinite(data)
+
+    if isinstance(data, Decimal):
+        return not data.is_finite()
+
+    if isinstance(data, dict):
+        return any(_has_non_finite_float(value) for value in data.values())
+
+    if isinstance(data, (list, tuple)):
+        return any(_has_non_finite_float(value) for value in data)
+
+    return False
+
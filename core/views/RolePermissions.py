@@ -0,0 +1,63 @@
+from ..db import versions
+
+# any of these grants the method
+METHOD_PERMISSIONS = {
+    "GET": frozenset(["view_owned", "view_all"]),
+    "POST": frozenset(["create"]),
+    "PUT": frozenset(["create"]),
+    "PATCH": frozenset(["edit_owned", "edit_all"]),
+    "DELETE": frozenset(["delete_owned", "delete_all"]),
+}
+
+# these grant the method on objects that aren't owned
+ALL_PERMISSIONS = {
+    "GET": "view_all",
+    "PATCH": "edit_all",
+    "DELETE": "delete_all",
+}
+
+VERSION = "role-permissions"
+
+
+def get(view, key):
+    """
+    The role permissions of the request for a permission key as a frozenset, or None if the request has no role
+    permissions. With 'role_permission_cache_timeout' set they are cached per 'get_role_permission_scope'
+    until 'invalidate' is called.
+    """
+    timeout = view.role_permission_cache_timeout
+    scope = view.get_role_permission_scope() if timeout else None
+
+    if scope is None:
+        return _resolve(view, key)
+
+    cache = versions.get_cache()
+    cache_key = f"api-utils:role-permissions:{versions.get_version(VERSION)}:{scope}:{key}"
+
+    # wrapped in a tuple so a request without role permissions (None) is cached as well
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached[0]
+
+    permissions = _resolve(view, key)
+    cache.set(cache_key, (permissions,), timeout)
+
+    return permissions
+
+
+def invalidate():
+    """
+    Drops the role permissions cached across requests, call it when roles or their permissions change.
+    """
+    versions.bump(VERSION)
+
+
+def _resolve(view, key):
+    role_permissions = view.get_request_permissions()
+
+    if not role_permissions:
+        return None
+
+    permissions = getattr(role_permissions, key)
+
+    return frozenset(permissions) if permissions is not None else None
@@ -0,0 +1,92 @@
+import logging
+import time
+
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger("core.timing")
+
+
+class Timer:
+    """
+    Adds up the time spent in each phase of a request, in seconds.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, duration):
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def get_timings(self):
+        return {**self.phases, "total": time.perf_counter() - self.start}
+
+
+class NullTimer:
+    """
+    The timer of requests without Server-Timing, every phase is a shared no-op context.
+    """
+    enabled = False
+    phases = {}
+
+    _context = nullcontext()
+
+    def phase(self, name):
+        return self._context
+
+    def add(self, name, duration):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def is_enabled():
+    return getattr(settings, "API_SERVER_TIMING", False)
+
+
+def get_hook():
+    """
+    The 'API_TIMING_HOOK' setting, a dotted path to a callable(view, request, response, timings) receiving the
+    phase durations of each timed request, e.g. to send them to a metrics backend.
+    """
+    path = getattr(settings, "API_TIMING_HOOK", None)
+    return import_string(path) if path else None
+
+
+def header(timings):
+    return ", ".join(f"{name};dur={duration * 1000:.2f}" for name, duration in timings.items())
+
+
+def finish(view, request, response, timer):
+    """
+    Renders the response inside the timer, adds the 'Server-Timing' header and calls the metrics hook.
+    """
+    if callable(getattr(response, "render", None)) and not getattr(response, "is_rendered", True):
+        with timer.phase("render"):
+            response.render()
+
+    timings = timer.get_timings()
+    response["Server-Timing"] = header(timings)
+
+    hook = get_hook()
+    if hook is not None:
+        try:
+            hook(view, request, response, timings)
+        except Exception:
+            logger.exception("API_TIMING_HOOK failed for %s", type(view).__qualname__)
+
+    return response
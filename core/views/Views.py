@@ -1,20 +1,101 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import CursorPagination, PageNumberPagination
-from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAdminUser
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.utils.urls import replace_query_param
 
-from django.db import transaction
+from asgiref.sync import sync_to_async
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+
+import base64
+import functools
+import hashlib
+import inspect
+import json
+import math
+
+from collections.abc import Iterator
 
 
 from core import Message
-from . import QueryParams, Export
+from core.serializers import BaseModelSerializer, bulk_create_instances, get_values_columns
+from core.db import versions
+from . import QueryParams, Export, ExportJobs, Conditional, Cache, Parsers, Queries, QueryStats, Renderers, \
+    RolePermissions, Timing
 
 
 class SmartAPIView(APIView):
     role_permission = False
     query_params = QueryParams
 
+    # answer GET requests with ETag/Last-Modified derived from 'updated_at' and return 304 to up to date clients,
+    # lists also derive them from the user and the model versions of 'cache_dependencies', see
+    # 'Conditional.list_validators'
+    conditional_get = False
+
+    # record the queries of each request (defaults to the API_QUERY_INSTRUMENTATION setting, else DEBUG), log
+    # likely N+1 access and, when exceeding 'query_budget', 'log', 'header' (X-Query-Count) or 'raise' in tests
+    query_instrumentation = None
+    query_budget = None
+    query_budget_action = "log"
+    n_plus_one_threshold = 5
+
+    # cache the role permissions across requests for this many seconds per 'get_role_permission_scope', until
+    # RolePermissions.invalidate() is called
+    role_permission_cache_timeout = None
+
+    # time the phases of each request (defaults to the API_SERVER_TIMING setting) into a Server-Timing header
+    # and the API_TIMING_HOOK metrics hook
+    server_timing = None
+    timer = Timing.NULL_TIMER
+
+    def dispatch(self, request, *args, **kwargs):
+        instrumentation = self.query_instrumentation
+        if instrumentation is None:
+            instrumentation = Queries.is_enabled()
+
+        server_timing = self.server_timing
+        if server_timing is None:
+            server_timing = Timing.is_enabled()
+
+        statistics = QueryStats.is_enabled()
+
+        if server_timing:
+            self.timer = Timing.Timer()
+
+        if not instrumentation and not statistics and not server_timing:
+            return super().dispatch(request, *args, **kwargs)
+
+        with Queries.record() as recorder:
+            response = super().dispatch(request, *args, **kwargs)
+
+        if statistics:
+            QueryStats.collect(self, request, recorder)
+
+        if instrumentation:
+            response = Queries.report(self, request, response, recorder, budget=self.query_budget,
+                                      action=self.query_budget_action, threshold=self.n_plus_one_threshold)
+
+        if server_timing:
+            self.timer.add("db", recorder.duration)
+            response = Timing.finish(self, request, response, self.timer)
+
+        return response
+
+    def is_allowed(self, request, method, model):
+        """
+        'has_permission' and 'has_role_permission', timed as the 'permission' phase.
+        """
+        with self.timer.phase("permission"):
+            return self.has_permission(request, method) and self.has_role_permission(method, model)
+
     def not_found(self, text="Object not found"):
 
         return Response(Message.create(text), status=status.HTTP_404_NOT_FOUND)
@@ -33,23 +114,23 @@ class SmartAPIView(APIView):
         return self.role_permission
 
     def get_role_permission(self, model):
-
-        role_permissions = self.get_permissions()
-
-        if not role_permissions:
-            return None
-
+        """
+        The role permissions for the model, resolved once per request.
+        """
         key = None
 
         if hasattr(model, "get_permission_key"):
             key = model.get_permission_key(self)
 
-        if role_permissions is None or key is None:
+        if key is None:
             return None
 
-        permissions = getattr(role_permissions, key)
+        role_permissions = self.__dict__.setdefault("_role_permissions", {})
+
+        if key not in role_permissions:
+            role_permissions[key] = RolePermissions.get(self, key)
 
-        return permissions
+        return role_permissions[key]
 
     def has_role_permission(self, method, model):
         permissions = self.get_role_permission(model)
@@ -57,27 +138,51 @@ class SmartAPIView(APIView):
         if permissions is None:
             return True
 
-        if method == "GET" and "view_owned" not in permissions and "view_all" not in permissions:
-            return False
+        required = RolePermissions.METHOD_PERMISSIONS.get(method)
 
-        if method in ["POST", "PUT"] and "create" not in permissions:
-            return False
+        return required is None or not permissions.isdisjoint(required)
 
-        if method == "PATCH" and "edit_owned" not in permissions and "edit_all" not in permissions:
-            return False
+    def get_permissions(self):
+        return []
 
-        if method == "DELETE" and "delete_owned" not in permissions and "delete_all" not in permissions:
-            return False
+    def get_request_permissions(self):
+        """
+        'get_permissions', called at most once per request.
+        """
+        if "_request_permissions" not in self.__dict__:
+            self._request_permissions = self.get_permissions()
 
-        return True
+        return self._request_permissions
 
-    def get_permissions(self):
-        return []
+    def get_role_permission_scope(self):
+        """
+        Who the role permissions cached across requests belong to, None to not cache them.
+        """
+        user = getattr(self.request, "user", None)
+
+        if user is None or user.is_anonymous:
+            return None
+
+        return user.pk
 
     def get_permission_denied_response(self, request, action):
         return self.respond_with("You do not have permission to access this",
                                  status_code=status.HTTP_403_FORBIDDEN)
 
+    def get_sparse_fields(self, serializer_class):
+        """
+        The '?fields=' and '?exclude=' sparse fieldsets e.g. 'id,user.name', for serializers that support them.
+        """
+        if not isinstance(serializer_class, type) or not issubclass(serializer_class, BaseModelSerializer):
+            return {}
+
+        sparse_fields = {
+            "fields": QueryParams.get_str_list(self.request, "fields"),
+            "exclude": QueryParams.get_str_list(self.request, "exclude"),
+        }
+
+        return {key: value for key, value in sparse_fields.items() if value}
+
 
 class SmartDetailAPIView(SmartAPIView):
 
@@ -101,16 +206,17 @@ class SmartDetailAPIView(SmartAPIView):
 
     def get(self, request, id):
 
-        if not self.has_permission(request, "GET") or not self.has_role_permission("GET", self.model):
+        if not self.is_allowed(request, "GET", self.model):
             return self.get_permission_denied_response(request, "GET")
 
-        queryset = self.queryset(request, id)
+        with self.timer.phase("queryset"):
+            queryset = self.queryset(request, id)
 
-        queryset = self.filter_queryset(queryset, "GET")
+            queryset = self.filter_queryset(queryset, "GET")
 
-        queryset = self.add_filters(queryset, request)
+            queryset = self.add_filters(queryset, request)
 
-        instance = queryset.first()
+            instance = queryset.first()
 
         if not instance:
             return self.get_instance_not_found_response(request, "GET")
@@ -118,12 +224,21 @@ class SmartDetailAPIView(SmartAPIView):
         if not self.get_detail_serializer(request, instance):
             return self.get_missing_serializer_response(request, "GET")
 
-        return self.handle_get(request, instance)
+        if not self.conditional_get:
+            return self.handle_get(request, instance)
+
+        etag, last_modified = self.get_detail_validators(request, instance)
+
+        not_modified = Conditional.not_modified(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        return Conditional.set_validators(self.handle_get(request, instance), etag, last_modified)
 
     @transaction.atomic
     def patch(self, request, id):
 
-        if not self.has_permission(request, "PATCH") or not self.has_role_permission("PATCH", self.model):
+        if not self.is_allowed(request, "PATCH", self.model):
             return self.get_permission_denied_response(request, "PATCH")
 
         queryset = self.queryset(request, id)
@@ -155,7 +270,7 @@ class SmartDetailAPIView(SmartAPIView):
     @transaction.atomic
     def delete(self, request, id):
 
-        if not self.deletable or not self.has_permission(request, "DELETE") or not self.has_role_permission("DELETE", self.model):
+        if not self.deletable or not self.is_allowed(request, "DELETE", self.model):
             return self.get_permission_denied_response(request, "DELETE")
 
         queryset = self.queryset(request, id)
@@ -199,10 +314,17 @@ class SmartDetailAPIView(SmartAPIView):
         message = f"{serializer_type} is not defined"
         return self.respond_with(message, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def get_detail_validators(self, request, instance):
+        return Conditional.detail_validators(
+            request, instance, type(self).__qualname__, self.get_detail_serializer(request, instance)
+        )
+
     def handle_get(self, request, instance):
 
         detail_serializer_class = self.get_detail_serializer(request, instance)
-        data = detail_serializer_class(instance).data
+
+        with self.timer.phase("serialize"):
+            data = detail_serializer_class(instance, **self.get_sparse_fields(detail_serializer_class)).data
 
         data = self.override_response_data(request, data)
 
@@ -238,10 +360,222 @@ class SmartDetailAPIView(SmartAPIView):
 
 # Pagination Classes
 class PageBasedPagination(PageNumberPagination):
+    """
+    Page number pagination with a selectable count strategy ('?count_mode='):
+
+    exact: COUNT(*) of the filtered queryset
+    none: no count, 'page_size + 1' rows are fetched to know if there is a next page
+    estimated: the planner's row estimate where the backend exposes it (postgresql), exact otherwise
+    cached: an exact count cached for 'count_cache_timeout' seconds per filter set and model version, exact
+            unless the 'API_CACHE_VERSIONS' setting is set
+
+    In every mode a page past the last one is a 404 and '?page=last' is the last page, which is found with an exact
+    count in the 'none' and 'estimated' modes. The response tells which mode was used in 'count_mode' when
+    '?count_mode=' is given or the default mode isn't 'exact'.
+    """
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
+    count_mode = "exact"
+    count_mode_query_param = "count_mode"
+    count_modes = ["exact", "none", "estimated", "cached"]
+    count_cache_timeout = 60
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.count_mode = self.get_count_mode(request)
+
+        if self.count_mode == "estimated":
+            self.count = _estimate_count(queryset)
+            if self.count is None:
+                self.count_mode = "exact"
+
+        if self.count_mode == "exact":
+            results = super().paginate_queryset(queryset, request, view=view)
+            self.count = self.page.paginator.count if results is not None else None
+            return results
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        if self.count_mode == "cached":
+            self.count = self.get_cached_count(queryset)
+
+        if self.count_mode == "none":
+            self.count = None
+
+        page_number = self.get_requested_page_number(request, page_size)
+
+        offset = (page_number - 1) * page_size
+
+        if self.count_mode == "cached":
+            self.check_page_number(page_number, offset >= self.count)
+
+        results = list(queryset[offset:offset + page_size + 1])
+
+        self.check_page_number(page_number, not results)
+
+        self.page = _Page(page_number, has_next=len(results) > page_size)
+
+        return results[:page_size]
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        'paginate_queryset' with the async ORM, every count mode fetches 'page_size + 1' rows to know if there is
+        a next page.
+        """
+        self.request = request
+        self.count_mode = self.get_count_mode(request)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        if self.count_mode == "estimated":
+            self.count = await sync_to_async(_estimate_count)(queryset)
+            if self.count is None:
+                self.count_mode = "exact"
+
+        if self.count_mode == "exact":
+            self.count = await queryset.acount()
+
+        if self.count_mode == "cached":
+            self.count = await sync_to_async(self.get_cached_count)(queryset)
+
+        if self.count_mode == "none":
+            self.count = None
+
+        page_number = self.get_requested_page_number(request, page_size)
+
+        offset = (page_number - 1) * page_size
+
+        if self.count_mode in ["exact", "cached"]:
+            self.check_page_number(page_number, offset >= self.count)
+
+        results = [instance async for instance in queryset[offset:offset + page_size + 1]]
+
+        self.check_page_number(page_number, not results)
+
+        self.page = _Page(page_number, has_next=len(results) > page_size)
+
+        return results[:page_size]
+
+    def get_requested_page_number(self, request, page_size):
+        """
+        The '?page=' number, the last page ('last_page_strings') is computed from the count.
+        """
+        page_number = request.query_params.get(self.page_query_param) or 1
+
+        if page_number in self.last_page_strings:
+            return max(math.ceil(self.count / page_size), 1)
+
+        try:
+            page_number = int(page_number)
+            if page_number < 1:
+                raise ValueError()
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(page_number=request.query_params.get(self.page_query_param),
+                                                            message="That page number is not a valid integer"))
+
+        return page_number
+
+    def check_page_number(self, page_number, past_last_page):
+        """
+        Raises a 404 for a page past the last one, as the exact count mode does. The first page may be empty.
+        """
+        if page_number > 1 and past_last_page:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number,
+                                                            message="That page contains no results"))
+
+    def get_paginated_response(self, data):
+        response = {'count': self.count}
+
+        # the responses of paginators counting exactly by default keep their shape unless a mode is requested
+        if self.count_mode_query_param in self.request.query_params or type(self).count_mode != "exact":
+            response['count_mode'] = self.count_mode
+
+        response.update({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['required'] = ['results']
+        response_schema['properties']['count']['nullable'] = True
+        response_schema['properties']['count_mode'] = {'type': 'string', 'enum': self.count_modes}
+        return response_schema
+
+    def get_count_mode(self, request):
+        count_mode = QueryParams.get_enum(request, self.count_mode_query_param, self.count_modes,
+                                          default_value=type(self).count_mode)
+
+        # the model versions the cached counts are keyed by are only bumped with 'API_CACHE_VERSIONS'
+        if count_mode == "cached" and not versions.is_enabled():
+            return "exact"
+
+        # the last page is found with an exact count
+        if count_mode in ["none", "estimated"] and \
+                request.query_params.get(self.page_query_param) in self.last_page_strings:
+            return "exact"
+
+        return count_mode
+
+    def get_cached_count(self, queryset):
+        cache = versions.get_cache()
+
+        sql, params = queryset.query.sql_with_params()
+        value = repr((sql, params, versions.get_version(queryset.model)))
+        key = f"api-utils:count:{hashlib.md5(value.encode('utf-8'), usedforsecurity=False).hexdigest()}"
+
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_timeout)
+
+        return count
+
+
+class _Page:
+    """
+    The part of django's Page used by PageNumberPagination's links, for pages fetched without a count.
+    """
+
+    def __init__(self, number, has_next):
+        self.number = number
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def _estimate_count(queryset):
+    """
+    :return: The planner's row estimate of the queryset, or None if the backend doesn't expose one
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return None
+
+    try:
+        plan = json.loads(queryset.order_by().explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except (DatabaseError, KeyError, IndexError, TypeError, ValueError):
+        return None
+
 
 class CursorSetPagination(CursorPagination):
     page_size = 20
@@ -253,6 +587,169 @@ class CursorOrderSetPagination(CursorPagination):
     ordering = ('order')
 
 
+class RowValue(Func):
+    """
+    A row value e.g. (a, b, id), compared as a whole in keyset predicates.
+    """
+    function = ""
+    template = "(%(expressions)s)"
+    output_field = Field()
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over any number of (nested) order fields, 'id' is always appended as a unique tiebreaker.
+
+    The cursor holds the order values of the first or last row of the page, the next page is fetched with a
+    row value predicate e.g. WHERE (a, b, id) > (...) so deep pages cost the same as the first one. Mixed
+    ascending and descending fields are expanded to (a > x) OR (a = x AND b < y) ... instead.
+    The order fields must not be nullable (see 'is_orderable'), PaginationAPIView paginates by page otherwise.
+    """
+    page_size = 20
+    ordering = '-created_at'
+    cursor_query_param = 'cursor'
+    tiebreaker = 'id'
+
+    # backends that support row value comparisons
+    row_value_vendors = ["postgresql", "mysql", "sqlite"]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+
+        ordering = self.get_ordering()
+        values, reverse = self.decode_cursor(request)
+
+        if values is not None:
+            if len(values) != len(ordering):
+                raise NotFound("Invalid cursor")
+
+            queryset = queryset.filter(self.get_predicate(queryset, ordering, values, reverse))
+
+        page_ordering = [_invert(field) for field in ordering] if reverse else ordering
+        results = list(queryset.order_by(*page_ordering)[:self.page_size + 1])
+
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+
+        self.has_next = has_more if not reverse else values is not None
+        self.has_previous = values is not None if not reverse else has_more
+
+        self.next_values = self.get_values(results[-1], ordering) if results and self.has_next else None
+        self.previous_values = self.get_values(results[0], ordering) if results and self.has_previous else None
+
+        # an empty page reached backwards or forwards can still go back the way it came
+        if not results and values is not None:
+            if reverse:
+                self.has_next, self.next_values = True, [_to_json(value) for value in values]
+            else:
+                self.has_previous, self.previous_values = True, [_to_json(value) for value in values]
+
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or self.next_values is None:
+            return None
+
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.next_values, False))
+
+    def get_previous_link(self):
+        if not self.has_previous or self.previous_values is None:
+            return None
+
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.previous_values, True))
+
+    def get_ordering(self):
+        ordering = [self.ordering] if isinstance(self.ordering, str) else list(self.ordering)
+
+        tiebreaker_names = [self.tiebreaker, "pk"]
+        if not any(field.lstrip("-") in tiebreaker_names for field in ordering):
+            direction = "-" if ordering and ordering[-1].startswith("-") else ""
+            ordering.append(f"{direction}{self.tiebreaker}")
+
+        return ordering
+
+    def get_predicate(self, queryset, ordering, values, reverse):
+        fields = [_get_field(queryset.model, field.lstrip("-")) for field in ordering]
+
+        try:
+            values = [field.to_python(value) if field is not None else value for field, value in zip(fields, values)]
+        except (DjangoValidationError, TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+
+        descending = [field.startswith("-") != reverse for field in ordering]
+
+        if len(set(descending)) == 1 and connections[queryset.db].vendor in self.row_value_vendors:
+            lhs = RowValue(*[F(field.lstrip("-")) for field in ordering])
+            rhs = RowValue(*[Value(value, output_field=field) if field is not None else Value(value)
+                             for field, value in zip(fields, values)])
+
+            return LessThan(lhs, rhs) if descending[0] else GreaterThan(lhs, rhs)
+
+        predicate = Q()
+        for index, field in enumerate(ordering):
+            condition = Q(**{f"{f.lstrip('-')}": value for f, value in zip(ordering[:index], values[:index])})
+            condition &= Q(**{f"{field.lstrip('-')}__{'lt' if descending[index] else 'gt'}": values[index]})
+            predicate |= condition
+
+        return predicate
+
+    def is_orderable(self, model, ordering):
+        """
+        :return: True if none of the order fields can be NULL, the predicates can't compare NULLs
+        """
+        return not any(_is_nullable(model, field.lstrip("-")) for field in ordering)
+
+    def get_values(self, instance, ordering):
+        return [_to_json(_get_value(instance, field.lstrip("-"))) for field in ordering]
+
+    def encode_cursor(self, values, reverse):
+        data = json.dumps([values, 1 if reverse else 0], cls=DjangoJSONEncoder, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def decode_cursor(self, request):
+        """
+        :return: (values, reverse), values is None for the first page
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        if not cursor:
+            return None, False
+
+        try:
+            data = base64.urlsafe_b64decode((cursor + "=" * (-len(cursor) % 4)).encode("ascii"))
+            values, reverse = json.loads(data)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound("Invalid cursor")
+
+        if not isinstance(values, list):
+            raise NotFound("Invalid cursor")
+
+        return values, bool(reverse)
+
+
 class PaginationAPIView(SmartAPIView):
     max_page_size = 40
     min_page_size = 5
@@ -262,6 +759,14 @@ class PaginationAPIView(SmartAPIView):
 
     allow_disable_pagination = False
 
+    # '?paginated=false' responses are streamed as a JSON array serialized 'stream_chunk_size' instances at a
+    # time instead of being built in memory ('get_response' isn't called)
+    stream_unpaginated = False
+    stream_chunk_size = Renderers.DEFAULT_CHUNK_SIZE
+
+    # exports requested with '?async=true' are spooled to disk by a background worker, see ExportJobAPIView
+    allow_async_export = False
+
     @property
     def paginator(self):
         """
@@ -273,16 +778,23 @@ class PaginationAPIView(SmartAPIView):
                 self._paginator = None
             else:
                 pagination_type = QueryParams.get_str(self.request, "pagination_type")
+                order_by = self.get_order_by()
+
+                # cursor pagination doesn't support nested or multiple order fields e.g. 'user__id', keyset does
+                nested_order_by = order_by is not None and (len(order_by) > 1 or "__" in order_by[0])
+                is_cursor_pagination = issubclass(self.pagination_class, CursorPagination)
 
                 if pagination_type == "page":
                     self._paginator = PageBasedPagination()
+                elif pagination_type == "keyset" or (is_cursor_pagination and nested_order_by):
+                    self._paginator = KeysetPagination()
+                    if is_cursor_pagination:
+                        self._paginator.ordering = self.pagination_class.ordering
                 else:
                     self._paginator = self.pagination_class()
 
-                # todo cursor pagination ordering doesn't support nesting e.g. order_by 'user__id' will cause crash
-                order_by = QueryParams.get_str(self.request, "order_by")
-                if order_by and "__" not in order_by:
-                    self._paginator.ordering = [order_by]
+                if order_by and (isinstance(self._paginator, KeysetPagination) or not nested_order_by):
+                    self._paginator.ordering = order_by
 
         return self._paginator
 
@@ -295,10 +807,34 @@ class PaginationAPIView(SmartAPIView):
 
         self.set_page_size()
 
-        order_by = QueryParams.get_str(self.request, "order_by")
+        # the paginators read the ordering fields of the page's instances, e.g. for the cursors
+        queryset = _undefer(queryset, [*(self.get_order_by() or []), *_to_list(getattr(self.paginator, "ordering", None))])
+
+        if isinstance(self.paginator, KeysetPagination):
+            ordering = self.paginator.get_ordering()
+
+            if self.paginator.is_orderable(queryset.model, ordering):
+                return self.paginator.paginate_queryset(queryset, self.request, view=self)
+
+            # the keyset predicates can't compare NULLs, nullable order fields are paginated by page instead
+            self._paginator = PageBasedPagination()
+            self.set_page_size()
+
+            return self.paginator.paginate_queryset(queryset.order_by(*ordering), self.request, view=self)
+
+        queryset = self.order_page_queryset(queryset)
+
+        page = self.paginator.paginate_queryset(queryset, self.request, view=self)
+        return page
+
+    def order_page_queryset(self, queryset):
+        """
+        The queryset ordered by '?order_by=' and then by the paginator's ordering.
+        """
+        order_by = self.get_order_by()
 
         if order_by:
-            queryset = queryset.order_by(order_by)
+            queryset = queryset.order_by(*order_by)
 
         if hasattr(self.paginator, "ordering"):
             if isinstance(self.paginator.ordering, list):
@@ -307,9 +843,7 @@ class PaginationAPIView(SmartAPIView):
             elif self.paginator.ordering:
                 queryset = queryset.order_by(self.paginator.ordering)
 
-
-        page = self.paginator.paginate_queryset(queryset, self.request, view=self)
-        return page
+        return queryset
 
     def get_paginated_response(self, data):
         """
@@ -321,6 +855,12 @@ class PaginationAPIView(SmartAPIView):
     def get_response(self, data):
         return Response(data)
 
+    def get_order_by(self):
+        """
+        The fields of '?order_by=' e.g. 'name,-user__id', or None
+        """
+        return QueryParams.get_str_list(self.request, "order_by")
+
     def set_page_size(self, extra=None):
 
         page_size = self.request.GET.get('page_size')
@@ -340,22 +880,25 @@ class PaginationAPIView(SmartAPIView):
 
     def paginated_response(self, queryset, serializer_class):
 
-        if hasattr(serializer_class, "optimise"):
-            queryset = serializer_class.optimise(queryset)
-        else:
-            print(f"\033[93m{serializer_class} query not optimised\x1b[0m")
-            pass
+        sparse_fields = self.get_sparse_fields(serializer_class)
+
+        queryset = self.optimise_queryset(queryset, serializer_class, sparse_fields)
 
         if QueryParams.get_str(self.request, 'export'):
+            if self.allow_async_export and QueryParams.get_bool(self.request, 'async', False):
+                job = ExportJobs.create(queryset, self.request)
+                return Response(ExportJobs.representation(job), status=status.HTTP_202_ACCEPTED)
+
             return Export.queryset(queryset, self.request)
 
-        order_by = QueryParams.get_str(self.request, "order_by")
+        order_by = self.get_order_by()
 
         if order_by:
             try:
-                queryset = queryset.order_by(order_by)
+                queryset = queryset.order_by(*order_by)
             except Exception as e:
-                return self.respond_with(f"This field: '{order_by}' is not valid", status_code=status.HTTP_400_BAD_REQUEST)
+                return self.respond_with(f"This field: '{','.join(order_by)}' is not valid",
+                                         status_code=status.HTTP_400_BAD_REQUEST)
 
         if self.allow_disable_pagination and QueryParams.get_bool(self.request, 'paginated') is False:
             if not order_by:
@@ -364,14 +907,70 @@ class PaginationAPIView(SmartAPIView):
                 else:
                     queryset = queryset.order_by(self.paginator.ordering)
 
-            data = serializer_class(queryset, many=True).data
+            if self.stream_unpaginated:
+                return Renderers.streamed_list_response(queryset, serializer_class, self.stream_chunk_size,
+                                                        **sparse_fields)
+
+            values_serializer = self.get_values_serializer(serializer_class, sparse_fields)
+
+            with self.timer.phase("serialize"):
+                if values_serializer is not None:
+                    data = values_serializer.represent_values(values_serializer.get_values_queryset(queryset))
+                else:
+                    data = serializer_class(queryset, many=True, **sparse_fields).data
+
             return self.get_response(data)
 
-        page = self.paginate_queryset(queryset)
+        values_serializer = None
+
+        # the cursors are read from the page's instances
+        if not isinstance(self.paginator, (CursorPagination, KeysetPagination)):
+            values_serializer = self.get_values_serializer(serializer_class, sparse_fields)
 
-        serializer = serializer_class(page, many=True)
+        if values_serializer is not None:
+            queryset = values_serializer.get_values_queryset(queryset)
 
-        return self.get_paginated_response(serializer.data)
+        with self.timer.phase("pagination"):
+            page = self.paginate_queryset(queryset)
+
+        with self.timer.phase("serialize"):
+            if values_serializer is not None:
+                data = values_serializer.represent_values(page)
+            else:
+                data = serializer_class(page, many=True, **sparse_fields).data
+
+        return self.get_paginated_response(data)
+
+    def optimise_queryset(self, queryset, serializer_class, sparse_fields):
+        """
+        The queryset optimised by the serializer's 'optimise'. The sparse fieldsets are only passed to an
+        'optimise' that accepts them, overrides with the older 'optimise(cls, queryset)' signature keep their
+        relations.
+        """
+        if not hasattr(serializer_class, "optimise"):
+            Queries.logger.warning("%s query not optimised", serializer_class,
+                                   extra={"view": type(self).__qualname__, "serializer": str(serializer_class)})
+            return queryset
+
+        if sparse_fields and _accepts_sparse_fields(serializer_class):
+            return serializer_class.optimise(queryset, **sparse_fields)
+
+        return serializer_class.optimise(queryset)
+
+    def get_values_serializer(self, serializer_class, sparse_fields):
+        """
+        A serializer rendering the values_list() rows of the queryset, for serializers with 'compiled_values'
+        whose fields are all plain columns and that don't override 'to_representation'. None otherwise.
+        """
+        if not getattr(serializer_class, "compiled_values", False):
+            return None
+
+        if serializer_class.to_representation is not BaseModelSerializer.to_representation:
+            return None
+
+        serializer = serializer_class(**sparse_fields)
+
+        return serializer if get_values_columns(serializer) is not None else None
 
 
 class SmartPaginationAPIView(PaginationAPIView):
@@ -382,8 +981,27 @@ class SmartPaginationAPIView(PaginationAPIView):
     bulk_serializer = None
     bulk_detail_serializer = None
 
+    # validate PUT's list with 'bulk_serializer'(many=True) and create it with 'bulk_create_instances', in INSERTs
+    # of 'bulk_batch_size' rows, instead of the bulk serializer's save(). The response is the
+    # 'bulk_detail_serializer'(many=True) of the created objects
+    bulk_insert = False
+    bulk_batch_size = 1000
+
+    # parse PUT's body (a JSON array or CSV) lazily with the streaming parsers and validate and insert it
+    # 'bulk_batch_size' rows at a time, the memory used is bounded by the batch size instead of the body. The rows
+    # are inserted in the request's transaction, which is rolled back if one is invalid, and up to
+    # 'bulk_max_errors' errors are reported. 'override_put_data' receives the iterator of the rows
+    stream_bulk_insert = False
+    bulk_max_errors = 100
+
     role_permission = False
 
+    # cache the list responses until the model (or one of 'cache_dependencies') is written to, the model
+    # versions this relies on are bumped only with the 'API_CACHE_VERSIONS' setting
+    cache_responses = False
+    cache_timeout = 60
+    cache_dependencies = []
+
     def queryset(self, request):
         objects = QueryParams.get_str(request, "objects")
 
@@ -396,26 +1014,71 @@ class SmartPaginationAPIView(PaginationAPIView):
 
     def get(self, request):
 
-        if not self.has_permission(request, "GET") or not self.has_role_permission("GET", self.model):
+        if not self.is_allowed(request, "GET", self.model):
             return self.get_permission_denied_response(request, "GET")
 
-        queryset = self.queryset(request)
+        with self.timer.phase("queryset"):
+            queryset = self.queryset(request)
 
-        queryset = self.filter_queryset(queryset, "GET")
+            queryset = self.filter_queryset(queryset, "GET")
 
-        queryset = self.add_filters(queryset, request)
+            queryset = self.add_filters(queryset, request)
 
         if not self.get_list_serializer(request, queryset):
             return self.get_missing_serializer_response(request, "GET")
 
         serializer_class = self.get_list_serializer(request, queryset)
 
-        return self.paginated_response(queryset, serializer_class)
+        if QueryParams.get_str(request, 'export'):
+            return self.paginated_response(queryset, serializer_class)
+
+        if not self.conditional_get:
+            return self.cached_paginated_response(queryset, serializer_class)
+
+        etag, last_modified = self.get_list_validators(request, queryset, serializer_class)
+
+        not_modified = Conditional.not_modified(request, etag, last_modified, Conditional.VARY)
+        if not_modified is not None:
+            return not_modified
+
+        response = self.cached_paginated_response(queryset, serializer_class)
+
+        return Conditional.set_validators(response, etag, last_modified, Conditional.VARY)
+
+    def cached_paginated_response(self, queryset, serializer_class):
+        """
+        'paginated_response' served from the cache when 'cache_responses' is set. The cache key includes a
+        version counter of the model and of 'cache_dependencies' that is bumped on every write to them. The
+        headers set by 'paginated_response' are cached with the data (see 'Cache.set').
+        """
+        if not self.cache_responses:
+            return self.paginated_response(queryset, serializer_class)
+
+        key = Cache.get_key(self, self.request, [self.model, *self.get_cache_dependencies()],
+                            self.get_cache_scope(self.request))
+
+        cached = Cache.get(self, key)
+        if cached is not None:
+            return Cache.to_response(cached)
+
+        response = self.paginated_response(queryset, serializer_class)
+
+        if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+            Cache.set(key, response, self.cache_timeout)
+
+        return response
+
+    def get_cache_dependencies(self):
+        return self.cache_dependencies
+
+    def get_cache_scope(self, request):
+        user = request.user
+        return "anonymous" if user is None or user.is_anonymous else user.pk
 
     @transaction.atomic
     def post(self, request):
 
-        if not self.has_permission(request, "POST") or not self.has_role_permission("POST", self.model):
+        if not self.is_allowed(request, "POST", self.model):
             return self.get_permission_denied_response(request, "POST")
 
         if not self.get_create_serializer(request):
@@ -445,7 +1108,7 @@ class SmartPaginationAPIView(PaginationAPIView):
     @transaction.atomic
     def put(self, request):
 
-        if not self.has_permission(request, "PUT") or not self.has_role_permission("PUT", self.model):
+        if not self.is_allowed(request, "PUT", self.model):
             return self.get_permission_denied_response(request, "PUT")
 
         if not self.get_bulk_create_serializer(request):
@@ -463,6 +1126,9 @@ class SmartPaginationAPIView(PaginationAPIView):
         if hasattr(self.request.data, "_mutable"):
             self.request.data._mutable = False
 
+        if self.bulk_insert or self.stream_bulk_insert:
+            return self.bulk_insert_response(request, bulk_create_serializer_class, data)
+
         bulk_create_serializer = bulk_create_serializer_class(data=data)
         bulk_create_serializer.is_valid(raise_exception=True)
         instance = bulk_create_serializer.save()
@@ -472,6 +1138,11 @@ class SmartPaginationAPIView(PaginationAPIView):
     def is_role_permission(self):
         return self.role_permission
 
+    def get_list_validators(self, request, queryset, serializer_class):
+        return Conditional.list_validators(request, queryset, type(self).__qualname__, serializer_class,
+                                           self.get_cache_scope(request),
+                                           models=[self.model, *self.get_cache_dependencies()])
+
     def post_response(self, request, instance, data):
         return Response(data, status=status.HTTP_201_CREATED)
 
@@ -481,6 +1152,100 @@ class SmartPaginationAPIView(PaginationAPIView):
 
         return self.post_response(request, instance, data)
 
+    def get_parsers(self):
+        if self.stream_bulk_insert and self.request.method == "PUT":
+            return [Parsers.StreamingJSONParser(), Parsers.StreamingCSVParser()]
+
+        return super().get_parsers()
+
+    def bulk_insert_response(self, request, serializer_class, data):
+        if isinstance(data, Iterator):
+            return self.streamed_bulk_insert_response(request, serializer_class, data)
+
+        if not isinstance(data, list):
+            return self.respond_with("Expected a list of objects", status_code=status.HTTP_400_BAD_REQUEST)
+
+        with self.timer.phase("validate"):
+            validated_data = self.validate_bulk_data(serializer_class, data)
+
+        with self.timer.phase("insert"):
+            instances = bulk_create_instances(serializer_class, validated_data, self.bulk_batch_size)
+
+        return self.bulk_created_response(request, instances)
+
+    def streamed_bulk_insert_response(self, request, serializer_class, rows):
+        """
+        Validates and inserts the rows parsed from the request stream one batch at a time. After an invalid row
+        nothing more is inserted, the rest is only validated to report its errors.
+
+        :return: The number of rows created e.g. {"count": 10000}
+        """
+        count = 0
+        errors = {}
+
+        for start, batch in Parsers.batches(rows, self.bulk_batch_size):
+            try:
+                with self.timer.phase("validate"):
+                    validated_data = self.validate_bulk_data(serializer_class, batch, start)
+            except ValidationError as e:
+                errors.update(e.detail)
+
+                if len(errors) >= self.bulk_max_errors:
+                    break
+
+                continue
+
+            if errors:
+                continue
+
+            with self.timer.phase("insert"):
+                count += len(bulk_create_instances(serializer_class, validated_data, self.bulk_batch_size))
+
+        if errors:
+            raise ValidationError(dict(list(errors.items())[:self.bulk_max_errors]))
+
+        return self.post_response(request, None, {"count": count})
+
+    def validate_bulk_data(self, serializer_class, data, start=0):
+        """
+        Validates every row before raising, the errors are by index of the row e.g. {"3": {"name": [...]}}.
+
+        :param start: The index of the first row of 'data'
+        """
+        serializer = serializer_class(data=data, many=True)
+
+        if serializer.is_valid():
+            return serializer.validated_data
+
+        errors = serializer.errors
+        if isinstance(errors, dict):
+            raise ValidationError(errors)
+
+        raise ValidationError({start + index: error for index, error in enumerate(errors) if error})
+
+    def bulk_created_response(self, request, instances):
+        """
+        The 'bulk_detail_serializer'(many=True) of the created instances, read again with one (optimised) query.
+        """
+        bulk_detail_serializer_class = self.get_bulk_detail_serializer(request, instances)
+
+        if instances:
+            pks = [instance.pk for instance in instances]
+            queryset = type(instances[0])._default_manager.filter(pk__in=pks)
+
+            if hasattr(bulk_detail_serializer_class, "optimise"):
+                queryset = bulk_detail_serializer_class.optimise(queryset)
+
+            with self.timer.phase("queryset"):
+                by_pk = {instance.pk: instance for instance in queryset}
+
+            instances = [by_pk[pk] for pk in pks if pk in by_pk]
+
+        with self.timer.phase("serialize"):
+            data = bulk_detail_serializer_class(instances, many=True).data
+
+        return self.post_response(request, instances, data)
+
     def get_create_serializer(self, request):
         return self.create_serializer
 
@@ -542,18 +1307,186 @@ class SmartPaginationAPIView(PaginationAPIView):
         return self.list_serializer
 
 
-def _filter_queryset(view, queryset, method):
-    permissions = view.get_role_permission(view.model)
-    if permissions is None:
-        return queryset
+class ExportJobAPIView(SmartAPIView):
+    """
+    Status, download ('?download=true'), resume (POST) and cancellation (DELETE) of the background export
+    jobs created by a PaginationAPIView with 'allow_async_export'.
+    """
+
+    def get(self, request, id):
+        job = ExportJobs.get(id)
+
+        if job is None or not self.has_job_permission(request, job):
+            return self.not_found()
+
+        if QueryParams.get_bool(request, "download", False):
+            if job["status"] != ExportJobs.FINISHED:
+                return self.respond_with("This export has not finished yet", status_code=status.HTTP_409_CONFLICT)
+
+            return ExportJobs.file_response(job)
+
+        return Response(ExportJobs.representation(job), status=status.HTTP_200_OK)
+
+    def post(self, request, id):
+        job = ExportJobs.get(id)
+
+        if job is None or not self.has_job_permission(request, job):
+            return self.not_found()
+
+        job = ExportJobs.resume(id)
+
+        return Response(ExportJobs.representation(job), status=status.HTTP_202_ACCEPTED)
+
+    def delete(self, request, id):
+        job = ExportJobs.get(id)
+
+        if job is None or not self.has_job_permission(request, job):
+            return self.not_found()
+
+        if QueryParams.get_bool(request, "purge", False):
+            ExportJobs.delete(id)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        job = ExportJobs.cancel(id)
+
+        return Response(ExportJobs.representation(job), status=status.HTTP_200_OK)
+
+    def has_job_permission(self, request, job):
+        if job["owner"] is None:
+            return True
+
+        user = request.user
+        return user is not None and not user.is_anonymous and str(user.pk) == job["owner"]
+
+
+class QueryStatsAPIView(APIView):
+    """
+    The SQL fingerprint statistics collected with the API_QUERY_STATS setting, admin only. DELETE resets them.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        order_by = QueryParams.get_enum(request, "order_by", QueryStats.ORDERINGS, "total", raise_exception=False)
+        limit = QueryParams.get_int(request, "limit", 50)
+        view = QueryParams.get_str(request, "view")
+
+        return Response(QueryStats.stats(order_by=order_by, limit=limit, view=view), status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        QueryStats.reset()
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-    if method == "GET" and "view_all" in permissions:
+
+def _invert(field):
+    return field[1:] if field.startswith("-") else f"-{field}"
+
+
+@functools.lru_cache(maxsize=None)
+def _accepts_sparse_fields(serializer_class):
+    try:
+        parameters = inspect.signature(serializer_class.optimise).parameters.values()
+    except (TypeError, ValueError):
+        return False
+
+    names = {parameter.name for parameter in parameters}
+
+    return {"fields", "exclude"} <= names or \
+        any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters)
+
+
+def _get_field(model, path):
+    """
+    :return: The model field at the end of a lookup path e.g. 'user__id', or None if it isn't a model field
+    """
+    field = None
+    for part in path.split("__"):
+        if model is None:
+            return None
+
+        try:
+            field = model._meta.pk if part == "pk" else model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+
+        model = field.related_model
+
+    return field
+
+
+def _is_nullable(model, path):
+    """
+    :return: True if the lookup path can be NULL, through a nullable field or relation on the way, or if it isn't
+    a model field
+    """
+    for part in path.split("__"):
+        if model is None:
+            return True
+
+        try:
+            field = model._meta.pk if part == "pk" else model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return True
+
+        if field.null:
+            return True
+
+        model = field.related_model
+
+    return False
+
+
+def _get_value(instance, path):
+    for part in path.split("__"):
+        instance = getattr(instance, part)
+
+    return instance
+
+
+def _to_json(value):
+    return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+
+def _to_list(ordering):
+    if not ordering:
+        return []
+
+    return list(ordering) if isinstance(ordering, (list, tuple)) else [ordering]
+
+
+def _undefer(queryset, ordering):
+    """
+    Loads the ordering fields of the model that 'only' or 'defer' left out, so reading them doesn't cost a
+    query per instance.
+    """
+    existing, defer = queryset.query.deferred_loading
+
+    if not existing:
         return queryset
 
-    if method == "PATCH" and "edit_all" in permissions:
+    names = {}
+    for field in queryset.model._meta.concrete_fields:
+        names[field.name] = names[field.attname] = field.name
+
+    fields = {names[name] for name in (path.lstrip("-").split("__")[0] for path in ordering) if name in names}
+
+    if defer and fields & existing:
+        remaining = existing - fields
+        queryset = queryset.defer(None)
+        return queryset.defer(*remaining) if remaining else queryset
+
+    if not defer and fields - existing:
+        return queryset.only(*existing, *fields)
+
+    return queryset
+
+
+def _filter_queryset(view, queryset, method):
+    permissions = view.get_role_permission(view.model)
+    if permissions is None:
         return queryset
 
-    if method == "DELETE" and "delete_all" in permissions:
+    if RolePermissions.ALL_PERMISSIONS.get(method) in permissions:
         return queryset
 
     admin = view.get_admin_from_request()
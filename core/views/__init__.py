@@ -1,2 +1,3 @@
 from .Views import *
-from ..views import Body, QueryParams, Export
\ No newline at end of file
+from .AsyncViews import *
+from ..views import Body, QueryParams, Cache, Conditional, Encoders, Export, ExportJobs, ExportPartitions, Parsers, Queries, QueryStats, Renderers, RolePermissions, Timing
\ No newline at end of file
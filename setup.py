@@ -9,7 +9,7 @@ setup(
     author="Begüm Akbay",
     author_email="begum@mosaic.ie",
     url="https://github.com/mosaic/django-api-utils",
-    packages=find_packages(),
+    packages=find_packages(exclude=["tests", "tests.*"]),
     include_package_data=True,
     install_requires=[
         "asgiref>=3.8.1,<4.0",
@@ -0,0 +1,24 @@
+import os
+
+import django
+import pytest
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def django_test_environment():
+    """
+    What 'manage.py test' does around the suite when it's run with pytest.
+    """
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, \
+        teardown_test_environment
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+
+    yield
+
+    teardown_databases(databases, verbosity=0)
+    teardown_test_environment()
@@ -0,0 +1,25 @@
+"""
+Settings of the test suite, run it from the repository root with:
+
+    python -m django test --settings=tests.settings
+"""
+
+SECRET_KEY = "tests"
+
+USE_TZ = True
+
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "rest_framework",
+    "tests",
+]
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    }
+}
+
+DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
@@ -0,0 +1,221 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase
+from rest_framework import serializers
+
+from core.serializers import BaseModelSerializer, _get_representation_plan, compare_representations
+from core.views import PaginationAPIView
+
+from .models import Author, Book
+
+
+class BookSerializer(BaseModelSerializer):
+    author_name = serializers.CharField(source="author.name", read_only=True)
+    label = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Book
+        fields = ["id", "author", "author_name", "title", "pages", "price", "available", "published_at", "label"]
+
+    def get_label(self, book):
+        return f"{self.context.get('prefix', '')}{book.title}"
+
+
+class BookValuesSerializer(BaseModelSerializer):
+    compiled_values = True
+
+    class Meta:
+        model = Book
+        fields = ["id", "author", "title", "pages", "price", "available", "published_at"]
+
+
+class OverriddenBookValuesSerializer(BookValuesSerializer):
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["title"] = data["title"].upper()
+        return data
+
+
+class NestedBookSerializer(BaseModelSerializer):
+
+    class Meta:
+        model = Book
+        fields = ["id", "title"]
+
+
+class AuthorSerializer(BaseModelSerializer):
+    books = NestedBookSerializer(many=True, required=False, nested_relation=True, related_name="books",
+                                 model_name_in_related_object="author", create_serializer=NestedBookSerializer,
+                                 edit_serializer=NestedBookSerializer)
+
+    class Meta:
+        model = Author
+        fields = ["id", "name", "books"]
+
+    def get_fields(self):
+        fields = super().get_fields()
+
+        if not self.context.get("with_books"):
+            fields.pop("books")
+
+        return fields
+
+
+def get_books():
+    author = Author(id=1, name="Ann")
+
+    return [
+        Book(id=1, author=author, title="First", pages=10, price=Decimal("9.90"), available=True,
+             published_at=datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc)),
+        Book(id=2, author=author, title="Second", pages=0, price=None, available=False, published_at=None),
+    ]
+
+
+class CompiledRepresentationTests(SimpleTestCase):
+
+    def test_compiled_representation_matches_standard(self):
+        self.assertEqual(compare_representations(BookSerializer, get_books()), [])
+
+    def test_compiled_representation_matches_standard_with_sparse_fields(self):
+        self.assertEqual(compare_representations(BookSerializer, get_books(), fields=["id", "price", "label"]), [])
+        self.assertEqual(compare_representations(BookSerializer, get_books(), exclude=["author_name"]), [])
+
+    def test_compiled_representation_uses_each_serializers_context(self):
+        compiled = type("CompiledBookSerializer", (BookSerializer,), {"compiled_representation": True})
+        book = get_books()[0]
+
+        self.assertEqual(compiled(book, context={"prefix": "a:"}).data["label"], "a:First")
+        self.assertEqual(compiled(book, context={"prefix": "b:"}).data["label"], "b:First")
+
+    def test_plan_is_cached_per_class_and_fields(self):
+        plan = _get_representation_plan(BookSerializer())
+
+        self.assertIs(_get_representation_plan(BookSerializer()), plan)
+        self.assertIsNot(_get_representation_plan(BookSerializer(fields=["id", "title"])), plan)
+        self.assertEqual([name for name, get, convert in _get_representation_plan(BookSerializer(fields=["id"]))],
+                         ["id"])
+
+
+class ValuesRepresentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name="Ann")
+        Book.objects.create(author=author, title="First", pages=10, price=Decimal("9.90"),
+                            published_at=datetime(2024, 1, 2, 3, 4, 5, 678000, tzinfo=timezone.utc))
+        Book.objects.create(author=None, title="Second", available=False)
+
+    def test_values_representation_matches_standard(self):
+        view = PaginationAPIView()
+        serializer = view.get_values_serializer(BookValuesSerializer, {})
+        queryset = Book.objects.order_by("id")
+
+        self.assertIsNotNone(serializer)
+        self.assertEqual(serializer.represent_values(serializer.get_values_queryset(queryset)),
+                         BookValuesSerializer(queryset, many=True).data)
+
+    def test_values_path_is_skipped_when_to_representation_is_overridden(self):
+        view = PaginationAPIView()
+
+        self.assertIsNone(view.get_values_serializer(OverriddenBookValuesSerializer, {}))
+
+
+class NestedRelationsTests(SimpleTestCase):
+
+    def test_nested_relations_follow_each_serializers_fields(self):
+        self.assertEqual(AuthorSerializer(context={}).nested_relations, ())
+        self.assertEqual([relation["related_name"] for relation in
+                          AuthorSerializer(context={"with_books": True}).nested_relations], ["books"])
+        self.assertEqual(AuthorSerializer(context={}).nested_relations, ())
+
+    def test_nested_relations_are_kept_with_sparse_fields(self):
+        serializer = AuthorSerializer(context={"with_books": True}, fields=["id"])
+
+        self.assertEqual(list(serializer.fields), ["id"])
+        self.assertEqual([relation["related_name"] for relation in serializer.nested_relations], ["books"])
+
+
+class PagesBookSerializer(BaseModelSerializer):
+
+    class Meta:
+        model = Book
+        fields = ["id", "title"]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["pages"] = instance.pages
+        return data
+
+
+class OnlyPagesBookSerializer(PagesBookSerializer):
+    optimise_only = True
+
+
+class OptimiseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.bulk_create([Book(title=f"Book {index}", pages=index) for index in range(5)])
+
+    def render(self, serializer_class):
+        return serializer_class(serializer_class.optimise(Book.objects.order_by("id")), many=True).data
+
+    def test_default_optimise_loads_every_column(self):
+        self.assertEqual(PagesBookSerializer.optimise(Book.objects.all()).query.deferred_loading, (set(), True))
+
+        with self.assertNumQueries(1):
+            self.assertEqual([book["pages"] for book in self.render(PagesBookSerializer)], [0, 1, 2, 3, 4])
+
+    def test_only_keeps_every_column_when_to_representation_is_overridden(self):
+        with self.assertNumQueries(1):
+            self.assertEqual([book["pages"] for book in self.render(OnlyPagesBookSerializer)], [0, 1, 2, 3, 4])
+
+    def test_only_restricts_columns_when_opted_in(self):
+        serializer_class = type("OnlyBookSerializer", (NestedBookSerializer,), {"optimise_only": True})
+
+        self.assertEqual(serializer_class.optimise(Book.objects.all()).query.deferred_loading,
+                         ({"id", "title"}, False))
+
+
+class AuthorBookSerializer(BaseModelSerializer):
+
+    class Meta:
+        model = Book
+        fields = ["id", "title", "author"]
+
+
+class LoadInstancesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ann = Author.objects.create(name="Ann")
+        cls.bob = Author.objects.create(name="Bob")
+        cls.first = Book.objects.create(author=cls.ann, title="First")
+        cls.second = Book.objects.create(author=cls.bob, title="Second")
+
+    def test_related_fields_are_only_loaded_in_bulk_for_lists(self):
+        self.assertIs(type(AuthorBookSerializer().fields["author"]), serializers.PrimaryKeyRelatedField)
+
+        serializer = AuthorBookSerializer(data=[{"title": "Third", "author": self.ann.id},
+                                                {"title": "Fourth", "author": self.ann.id},
+                                                {"title": "Fifth", "author": self.bob.id}], many=True)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        self.assertEqual([item["author"] for item in serializer.validated_data], [self.ann, self.ann, self.bob])
+
+    def test_nested_instances_are_loaded_once_for_every_item_of_a_list(self):
+        serializer = AuthorSerializer(data=[
+            {"id": self.ann.id, "name": "Ann", "books": [{"id": self.first.id, "title": "First!"}]},
+            {"id": self.bob.id, "name": "Bob", "books": [{"id": self.second.id, "title": "Second!"}]},
+        ], many=True, context={"with_books": True})
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        nested_relation = {"field_name": "books"}
+        self.assertEqual(serializer.child.get_nested_instances(nested_relation),
+                         {self.first.id: self.first, self.second.id: self.second})
@@ -0,0 +1,595 @@
+from concurrent.futures import Future
+from datetime import date, datetime, timezone
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db.models import Prefetch
+from django.db.models.signals import post_save
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.db import versions
+from core.serializers import BaseModelSerializer
+from core.views import AsyncSmartPaginationAPIView, Export, ExportJobs, ExportPartitions, KeysetPagination, \
+    PageBasedPagination, PaginationAPIView, SmartPaginationAPIView
+
+from .models import Author, Book
+
+
+class BookSerializer(BaseModelSerializer):
+
+    class Meta:
+        model = Book
+        fields = ["id", "title", "author"]
+
+
+class LegacyOptimiseBookSerializer(BookSerializer):
+
+    @classmethod
+    def optimise(cls, queryset):
+        return queryset.select_related("author")
+
+
+class OptimiseQuerysetTests(SimpleTestCase):
+
+    def test_sparse_fields_are_passed_to_optimise(self):
+        queryset = PaginationAPIView().optimise_queryset(Book.objects.all(), BookSerializer, {"fields": ["id"]})
+
+        self.assertEqual(queryset.query.deferred_loading, ({"title", "author"}, True))
+
+    def test_optimise_without_sparse_fields_parameters_is_called_without_them(self):
+        queryset = PaginationAPIView().optimise_queryset(Book.objects.all(), LegacyOptimiseBookSerializer,
+                                                         {"fields": ["id"]})
+
+        self.assertEqual(queryset.query.select_related, {"author": {}})
+
+
+class ExportChunkSizeTests(SimpleTestCase):
+
+    def get_request(self, **params):
+        return Request(APIRequestFactory().get("/", params))
+
+    def test_chunk_size_defaults_when_missing(self):
+        self.assertEqual(Export.get_chunk_size(self.get_request(), 500), 500)
+        self.assertEqual(Export.get_chunk_size(self.get_request(chunk_size="10"), 500), 10)
+
+    def test_chunk_size_below_one_is_rejected(self):
+        for chunk_size in ["0", "-5", "x"]:
+            with self.assertRaises(APIException) as context:
+                Export.get_chunk_size(self.get_request(chunk_size=chunk_size))
+
+            self.assertEqual(context.exception.status_code, 400)
+
+
+class TimeSeriesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.create(title="First", published_at=datetime(2024, 1, 1, 10, tzinfo=timezone.utc))
+        Book.objects.create(title="Second", published_at=datetime(2024, 1, 3, 10, tzinfo=timezone.utc))
+        Book.objects.create(title="Third", published_at=datetime(2024, 1, 3, 12, tzinfo=timezone.utc))
+        Book.objects.create(title="Unpublished", published_at=None)
+
+    def test_entries_without_a_date_are_skipped_and_gaps_are_filled(self):
+        self.assertEqual(Export.time_series(Book.objects.all(), "published_at"), [
+            {"date": date(2024, 1, 1), "count": 1},
+            {"date": date(2024, 1, 2), "count": 0},
+            {"date": date(2024, 1, 3), "count": 2},
+        ])
+
+    def test_only_entries_without_a_date_give_an_empty_series(self):
+        self.assertEqual(Export.time_series(Book.objects.filter(published_at=None), "published_at"), [])
+
+
+class BulkBookSerializer(BaseModelSerializer):
+
+    class Meta:
+        model = Book
+        fields = ["id", "title", "pages"]
+
+
+class BulkInsertView(SmartPaginationAPIView):
+    model = Book
+    bulk_serializer = BulkBookSerializer
+    bulk_detail_serializer = BulkBookSerializer
+    bulk_insert = True
+    bulk_batch_size = 2
+
+
+class StreamedBulkInsertView(BulkInsertView):
+    bulk_insert = False
+    stream_bulk_insert = True
+
+
+class BulkInsertTests(TestCase):
+
+    def put(self, view_class, data, content_type="application/json"):
+        request = APIRequestFactory().put("/", data, content_type=content_type)
+        return view_class.as_view()(request)
+
+    def test_bulk_insert_creates_the_rows(self):
+        response = self.put(BulkInsertView, '[{"title": "First", "pages": 1}, {"title": "Second"}, {"title": "Third"}]')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([book["title"] for book in response.data], ["First", "Second", "Third"])
+        self.assertEqual(list(Book.objects.order_by("id").values_list("title", "pages")),
+                         [("First", 1), ("Second", 0), ("Third", 0)])
+
+    def test_bulk_insert_reports_errors_by_row_index(self):
+        response = self.put(BulkInsertView, '[{"title": "First"}, {"pages": 1}, {"title": "Third", "pages": "x"}]')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.data), [1, 2])
+        self.assertIn("title", response.data[1])
+        self.assertIn("pages", response.data[2])
+        self.assertFalse(Book.objects.exists())
+
+    def test_bulk_insert_rejects_a_body_that_is_not_a_list(self):
+        response = self.put(BulkInsertView, '{"title": "First"}')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_streamed_bulk_insert_counts_the_rows(self):
+        response = self.put(StreamedBulkInsertView, "title,pages\nFirst,1\nSecond,2\nThird,3\n",
+                            content_type="text/csv")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {"count": 3})
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_streamed_bulk_insert_reports_errors_across_batches(self):
+        response = self.put(StreamedBulkInsertView, '[{"title": "First"}, {"title": "Second"}, {"pages": 1}, '
+                                                    '{"title": "Fourth"}, {"title": "Fifth", "pages": "x"}]')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.data), [2, 4])
+
+    def test_bulk_insert_saves_each_row_when_the_model_has_save_receivers(self):
+        saved = []
+
+        def receiver(sender, instance, created, **kwargs):
+            saved.append(instance.title)
+
+        post_save.connect(receiver, sender=Book)
+        try:
+            response = self.put(BulkInsertView, '[{"title": "First"}, {"title": "Second"}]')
+        finally:
+            post_save.disconnect(receiver, sender=Book)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(saved, ["First", "Second"])
+
+
+class ExportJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.bulk_create([Book(title=f"Book {index}", pages=index) for index in range(5)])
+
+    def setUp(self):
+        executor = mock.patch.object(ExportJobs, "get_executor")
+        self.submit = executor.start().return_value.submit
+        self.addCleanup(executor.stop)
+
+    def create(self, **params):
+        job = ExportJobs.create(Book.objects.all(), Request(APIRequestFactory().get("/", params)))
+        self.addCleanup(ExportJobs.delete, job["id"])
+        return job
+
+    def read(self, job):
+        with open(ExportJobs._path(job["id"], "csv"), "rb") as file:
+            return file.read()
+
+    def test_resumed_job_continues_after_the_last_row_written(self):
+        expected = self.create(chunk_size="2")
+        ExportJobs.run(expected["id"], 1)
+
+        job = self.create(chunk_size="2")
+        write_chunk = ExportJobs._write_chunk
+
+        def cancel_after_first_rows(file, data, current, rows, last):
+            written = write_chunk(file, data, current, rows, last)
+            if rows:
+                ExportJobs.cancel(current["id"])
+            return written
+
+        with mock.patch.object(ExportJobs, "_write_chunk", cancel_after_first_rows):
+            ExportJobs.run(job["id"], 1)
+
+        self.assertEqual(ExportJobs.get(job["id"])["status"], ExportJobs.CANCELLED)
+        self.assertEqual(ExportJobs.get(job["id"])["rows"], 2)
+
+        resumed = ExportJobs.resume(job["id"])
+        self.assertEqual((resumed["status"], resumed["attempt"]), (ExportJobs.PENDING, 2))
+        self.submit.assert_called_with(ExportJobs.run, job["id"], 2)
+
+        # the previous attempt doesn't run again
+        ExportJobs.run(job["id"], 1)
+        self.assertEqual(ExportJobs.get(job["id"])["status"], ExportJobs.PENDING)
+
+        ExportJobs.run(job["id"], 2)
+
+        self.assertEqual(ExportJobs.get(job["id"])["status"], ExportJobs.FINISHED)
+        self.assertEqual(ExportJobs.get(job["id"])["rows"], 5)
+        self.assertEqual(self.read(job), self.read(expected))
+
+    def test_previous_attempt_does_not_overwrite_the_resumed_job(self):
+        job = self.create()
+
+        stale = ExportJobs.get(job["id"])
+        stale["status"] = ExportJobs.RUNNING
+        ExportJobs.save(stale)
+
+        ExportJobs.cancel(job["id"])
+        ExportJobs.resume(job["id"])
+
+        with open(ExportJobs._path(job["id"], "part"), "wb") as file:
+            self.assertFalse(ExportJobs._write_chunk(file, b"id\n", stale, 1, [1]))
+
+        current = ExportJobs.get(job["id"])
+        self.assertEqual((current["status"], current["attempt"], current["rows"]), (ExportJobs.PENDING, 2, 0))
+
+    def test_finished_jobs_are_not_cancelled_or_resumed(self):
+        job = self.create()
+        ExportJobs.run(job["id"], 1)
+
+        self.assertEqual(ExportJobs.cancel(job["id"])["status"], ExportJobs.FINISHED)
+        self.assertEqual(ExportJobs.resume(job["id"])["attempt"], 1)
+        self.assertIsNone(ExportJobs.cancel("missing"))
+
+    def test_nullable_ordering_is_rejected(self):
+        self.assertEqual(ExportJobs.get_ordering(Book.objects.order_by("-title")), ["-title", "pk"])
+
+        for ordering in ["published_at", "author__name"]:
+            with self.assertRaises(APIException) as context:
+                ExportJobs.get_ordering(Book.objects.order_by(ordering))
+
+            self.assertEqual(context.exception.status_code, 400)
+
+
+class ConditionalBookListView(SmartPaginationAPIView):
+    model = Book
+    list_serializer = BookSerializer
+    conditional_get = True
+    cache_dependencies = [Author]
+
+
+@override_settings(API_CACHE_VERSIONS=True)
+class ConditionalListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name="Ann")
+        Book.objects.create(author=author, title="First")
+
+    def get(self, **headers):
+        return ConditionalBookListView.as_view()(APIRequestFactory().get("/", **headers))
+
+    def test_etag_changes_with_the_versions_of_the_dependencies(self):
+        etag = self.get()["ETag"]
+
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # e.g. an author renamed with update(), which doesn't touch the books' updated_at
+        versions.bump(Author)
+
+        self.assertNotEqual(self.get()["ETag"], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_is_scoped_to_the_user(self):
+        response = self.get()
+        view = ConditionalBookListView()
+        request = Request(APIRequestFactory().get("/"))
+
+        with mock.patch.object(ConditionalBookListView, "get_cache_scope", return_value=1):
+            self.assertNotEqual(view.get_list_validators(request, Book.objects.all(), BookSerializer)[0],
+                                response["ETag"])
+
+        self.assertIn("Authorization", response["Vary"])
+        self.assertIn("Cookie", response["Vary"])
+        self.assertIn("Cookie", self.get(HTTP_IF_NONE_MATCH=response["ETag"])["Vary"])
+
+
+class PageBookListView(SmartPaginationAPIView):
+    model = Book
+    list_serializer = BookSerializer
+    pagination_class = PageBasedPagination
+
+
+@override_settings(API_CACHE_VERSIONS=True)
+class PageBasedPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.bulk_create([Book(title=f"Book {index}") for index in range(7)])
+
+    def get(self, **params):
+        return PageBookListView.as_view()(APIRequestFactory().get("/", {"page_size": 5, "order_by": "id", **params}))
+
+    def paginate(self, paginate, **params):
+        paginator = PageBasedPagination()
+        paginator.page_size = 5
+        request = Request(APIRequestFactory().get("/", params))
+
+        return paginator, paginate(paginator)(Book.objects.order_by("id"), request)
+
+    def test_pages_of_every_count_mode(self):
+        for count_mode, count in [("exact", 7), ("none", None), ("estimated", 7), ("cached", 7)]:
+            with self.subTest(count_mode):
+                response = self.get(count_mode=count_mode, page=2)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data["count"], count)
+                self.assertEqual(len(response.data["results"]), 2)
+
+    def test_page_past_the_last_one_is_not_found_in_every_count_mode(self):
+        for count_mode in PageBasedPagination.count_modes:
+            with self.subTest(count_mode):
+                self.assertEqual(self.get(count_mode=count_mode, page=3).status_code, 404)
+                self.assertEqual(self.get(count_mode=count_mode, page=1).status_code, 200)
+
+                with self.assertRaises(NotFound):
+                    self.paginate(lambda paginator: async_to_sync(paginator.apaginate_queryset),
+                                  count_mode=count_mode, page=3)
+
+    def test_last_page_in_every_count_mode(self):
+        for count_mode in PageBasedPagination.count_modes:
+            with self.subTest(count_mode):
+                response = self.get(count_mode=count_mode, page="last")
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([book["title"] for book in response.data["results"]], ["Book 5", "Book 6"])
+
+                paginator, page = self.paginate(lambda paginator: async_to_sync(paginator.apaginate_queryset),
+                                                count_mode=count_mode, page="last")
+
+                self.assertEqual([book.title for book in page], ["Book 5", "Book 6"])
+                self.assertEqual(paginator.count, 7)
+
+    def test_count_mode_is_only_shown_when_requested(self):
+        self.assertNotIn("count_mode", self.get().data)
+        self.assertEqual(self.get(count_mode="none").data["count_mode"], "none")
+
+
+class ExportRelationsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name="Ann")
+        cls.long_book = Book.objects.create(author=author, title="Long", pages=500)
+        Book.objects.create(author=author, title="Short", pages=5)
+
+    def test_prefetch_of_the_queryset_is_kept(self):
+        queryset = Author.objects.prefetch_related(
+            Prefetch("books", queryset=Book.objects.filter(pages__gt=100), to_attr="long_books"))
+        options = {"columns": [{"name": "Name", "accessor": "name"},
+                               {"name": "Long books", "accessor": "long_books"}]}
+
+        with self.assertNumQueries(2):
+            rows = list(Export.iter_custom_values(queryset, options, chunk_size=10))
+
+        self.assertEqual(rows, [["Ann", [self.long_book]]])
+
+    def test_select_related_of_the_queryset_is_kept(self):
+        queryset = Book.objects.select_related("author").order_by("id")
+        options = {"columns": [{"name": "Title", "accessor": "title"},
+                               {"name": "Author", "accessor": "author"}]}
+
+        with self.assertNumQueries(1):
+            rows = [[title, author.name] for title, author in Export.iter_custom_values(queryset, options)]
+
+        self.assertEqual(rows, [["Long", "Ann"], ["Short", "Ann"]])
+
+
+class InlineExecutor:
+    """
+    Runs the partitions in the test's process, where the test database is.
+    """
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+class ExportPartitionsTests(TransactionTestCase):
+
+    def setUp(self):
+        Book.objects.bulk_create([Book(title=f"Book {index}", pages=index % 4) for index in range(21)])
+
+        executor = mock.patch.object(ExportPartitions, "get_executor", return_value=InlineExecutor())
+        executor.start()
+        self.addCleanup(executor.stop)
+
+    def test_ranges_are_read_in_one_query(self):
+        with self.assertNumQueries(1):
+            ranges = ExportPartitions._get_ranges(Book.objects.all(), "pk", 4, 2)
+
+        pks = sorted(Book.objects.values_list("pk", flat=True))
+
+        sizes = [len([pk for pk in pks if (lower is None or pk >= lower) and (upper is None or pk < upper)])
+                 for lower, upper in ranges]
+
+        # the boundaries fall on every 'chunk_size'th row
+        self.assertEqual(sum(sizes), 21)
+        self.assertTrue(all(abs(size - 21 / 4) <= 2 for size in sizes), sizes)
+
+    def test_partitioned_output_is_identical_to_the_serial_one(self):
+        options = {"columns": [{"name": "Title", "accessor": "title"}, {"name": "Pages", "accessor": "pages"}]}
+
+        for partition_by, ordering in [("pk", ["pk"]), ("pages", ["pages", "pk"]), ("pk", ["-pk"])]:
+            for export_options in [None, options]:
+                with self.subTest(partition_by=partition_by, ordering=ordering, options=export_options):
+                    queryset = Book.objects.order_by(*ordering)
+
+                    with mock.patch.object(Export, "stream", wraps=Export.stream) as serial:
+                        partitioned = b"".join(_to_bytes(chunk) for chunk in ExportPartitions.stream(
+                            queryset, export_options, chunk_size=2, partition_by=partition_by, partitions=4))
+
+                    serial.assert_not_called()
+
+                    self.assertEqual(partitioned, b"".join(_to_bytes(chunk) for chunk in Export.stream(
+                        queryset, export_options, chunk_size=2)))
+
+
+def _to_bytes(chunk):
+    return chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+
+
+class AsyncPageBookListView(AsyncSmartPaginationAPIView):
+    model = Book
+    list_serializer = BookSerializer
+    pagination_class = PageBasedPagination
+    query_instrumentation = True
+    query_budget_action = "header"
+    server_timing = True
+
+
+class InstrumentedPageBookListView(PageBookListView):
+    query_instrumentation = True
+    query_budget_action = "header"
+    server_timing = True
+
+
+class AsyncViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.bulk_create([Book(title=f"Book {index}") for index in range(7)])
+
+    def get(self, **params):
+        params = {"page_size": 5, "order_by": "id", **params}
+
+        response = async_to_sync(AsyncPageBookListView.as_view())(AsyncRequestFactory().get("/", params))
+        expected = InstrumentedPageBookListView.as_view()(APIRequestFactory().get("/", params))
+
+        return response, expected
+
+    def test_pages_match_the_sync_view(self):
+        for page in [1, 2, "last"]:
+            with self.subTest(page):
+                response, expected = self.get(page=page)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data, expected.data)
+
+    def test_page_past_the_last_one_is_handled_by_adispatch(self):
+        response, expected = self.get(page=3)
+
+        self.assertEqual((response.status_code, expected.status_code), (404, 404))
+
+    def test_queries_and_phases_are_recorded(self):
+        response, expected = self.get()
+
+        self.assertEqual(response["X-Query-Count"], expected["X-Query-Count"])
+        self.assertIn("pagination", response["Server-Timing"])
+        self.assertIn("db", response["Server-Timing"])
+
+
+class KeysetBookListView(SmartPaginationAPIView):
+    model = Book
+    list_serializer = BookSerializer
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(name="Ann")
+        Book.objects.bulk_create([
+            Book(author=author if index % 2 else None, title=f"Book {index % 3}", pages=index % 4,
+                 published_at=datetime(2024, 1, index + 1, tzinfo=timezone.utc) if index % 3 else None)
+            for index in range(12)
+        ])
+
+    def paginate(self, ordering, url="/"):
+        paginator = KeysetPagination()
+        paginator.page_size = 5
+        paginator.ordering = ordering
+
+        page = paginator.paginate_queryset(Book.objects.all(), Request(APIRequestFactory().get(url)))
+
+        return paginator, [book.id for book in page]
+
+    def test_pages_follow_the_ordering_forwards_and_backwards(self):
+        for ordering in [["pages", "title"], ["-pages", "-title"], ["pages", "-title"], ["-title", "pages"]]:
+            with self.subTest(ordering):
+                expected = list(Book.objects.order_by(*ordering, "id" if ordering[-1][0] != "-" else "-id")
+                                .values_list("id", flat=True))
+
+                pages = []
+                paginator, page = self.paginate(ordering)
+                pages.append(page)
+
+                while paginator.get_next_link():
+                    paginator, page = self.paginate(ordering, paginator.get_next_link())
+                    pages.append(page)
+
+                self.assertEqual([book_id for page in pages for book_id in page], expected)
+
+                previous = []
+                while paginator.get_previous_link():
+                    paginator, page = self.paginate(ordering, paginator.get_previous_link())
+                    previous.insert(0, page)
+
+                self.assertEqual(previous, pages[:-1])
+
+    def test_nullable_order_fields_are_paginated_by_page(self):
+        view = KeysetBookListView.as_view()
+
+        response = view(APIRequestFactory().get("/", {"order_by": "published_at,title", "page_size": 5}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 12)
+        self.assertEqual([book["id"] for book in response.data["results"]],
+                         list(Book.objects.order_by("published_at", "title", "id").values_list("id", flat=True)[:5]))
+
+        response = view(APIRequestFactory().get("/", {"order_by": "pages,title", "page_size": 5}))
+
+        self.assertNotIn("count", response.data)
+
+
+class CachedBookListView(SmartPaginationAPIView):
+    model = Book
+    list_serializer = BookSerializer
+    cache_responses = True
+    server_timing = True
+
+    def paginated_response(self, queryset, serializer_class):
+        response = super().paginated_response(queryset, serializer_class)
+        response["X-Total-Pages"] = "1"
+        return response
+
+
+class AsyncCachedBookListView(AsyncSmartPaginationAPIView, CachedBookListView):
+
+    async def apaginated_response(self, queryset, serializer_class):
+        response = await super().apaginated_response(queryset, serializer_class)
+        response["X-Total-Pages"] = "1"
+        return response
+
+
+@override_settings(API_CACHE_VERSIONS=True)
+class CachedResponseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.create(title="First")
+
+    def test_hits_keep_the_headers_of_the_response(self):
+        for view_class, get in [(CachedBookListView, lambda view, request: view(request)),
+                                (AsyncCachedBookListView, lambda view, request: async_to_sync(view)(request))]:
+            with self.subTest(view_class.__name__):
+                view = view_class.as_view()
+                miss = get(view, APIRequestFactory().get("/", {"view": view_class.__name__}))
+                hit = get(view, APIRequestFactory().get("/", {"view": view_class.__name__}))
+
+                miss.render()
+                hit.render()
+
+                self.assertEqual(hit.data, miss.data)
+                self.assertEqual(hit["X-Total-Pages"], "1")
+                self.assertEqual(hit["Content-Type"], miss["Content-Type"])
+                self.assertIn("Server-Timing", hit)